@@ -1,14 +1,20 @@
 import argparse
 import re
+import sys
 import time
 import html
 import unicodedata
+from pathlib import Path
 from urllib.parse import quote_plus, urljoin
 
 import requests
 from bs4 import BeautifulSoup
 from rapidfuzz import fuzz, process
 
+# cache de resoluções compartilhado com os resolvedores da raiz do projeto
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from tdn_resolucoes import CacheResolucoes
+
 TDN_ROOT = "https://tdn.totvs.com.br"
 
 HDRS = {
@@ -111,14 +117,20 @@ def score_result(title: str, code: str, cand_title: str) -> int:
     return base
 
 def find_best_link_for_title(title: str, session: requests.Session):
+    """
+    (best, falhou): best = (score, url, cand_title, used_query) ou None;
+    falhou=True se alguma busca deu erro (então um None não é confiável).
+    """
     queries, code = build_queries(title)
 
     best = None  # (score, url, cand_title, used_query)
+    falhou = False
     for q in queries:
         try:
             results = confluence_site_search(q, session, max_results=12)
         except Exception as e:
             print(f"   ↳ erro busca [{q}]: {e}")
+            falhou = True
             continue
 
         # Rankeia localmente
@@ -142,7 +154,7 @@ def find_best_link_for_title(title: str, session: requests.Session):
         # Respiro curto para não chamar atenção (e não tomar 403)
         time.sleep(0.3)
 
-    return best  # ou None
+    return best, falhou
 
 def main():
     ap = argparse.ArgumentParser(description="Busca links no TDN pela busca nativa do Confluence, priorizando TOTVS/Datasul/TDN.")
@@ -150,6 +162,7 @@ def main():
     ap.add_argument("--out-found", default="links_restantes_encontrados.txt", help="Saída dos encontrados.")
     ap.add_argument("--out-missing", default="nao_encontrados_restantes.txt", help="Saída dos que ainda faltam.")
     ap.add_argument("--sleep", type=float, default=0.35, help="Intervalo entre buscas.")
+    ap.add_argument("--sem-cache", action="store_true", help="Ignora o cache de resoluções (busca de novo e regrava).")
     args = ap.parse_args()
 
     with open(args.input, "r", encoding="utf-8") as f:
@@ -158,24 +171,37 @@ def main():
     print(f"📄 Títulos a buscar: {len(titulos)}")
 
     sess = requests.Session()
+    cache = CacheResolucoes()
     encontrados = []
     faltando = []
 
     for idx, t in enumerate(titulos, 1):
         print(f"[{idx}/{len(titulos)}] 🔎 {t}")
+        hit = None if args.sem_cache else cache.buscar(t, "busca_nativa")
+        if hit is not None:
+            if hit["url"]:
+                print(f"   ✅ (cache, {hit['quem']})  ->  {hit['url']}")
+                encontrados.append(f"{t} :: {hit['url']}")
+            else:
+                print("   ⚠️ não encontrado (cache)")
+                faltando.append(t)
+            continue
         try:
-            best = find_best_link_for_title(t, sess)
+            best, erro = find_best_link_for_title(t, sess)
         except Exception as e:
             print(f"   ❌ erro inesperado: {e}")
-            best = None
+            best, erro = None, True
 
         if best:
             score, url, cand_title, used_q = best
             print(f"   ✅ {cand_title}  ->  {url}  (score {score}, query {used_q})")
             encontrados.append(f"{t} :: {url}")
+            cache.gravar(t, "busca_nativa", url, f"busca nativa: {used_q}", score)
         else:
             print(f"   ⚠️ não encontrado")
             faltando.append(t)
+            if not erro:
+                cache.gravar(t, "busca_nativa", "")
 
         time.sleep(args.sleep)
 
@@ -17,18 +17,34 @@ PDFs_TDN/
 
 Mostra progresso, gera log.csv e status.json.
 Aceita também linhas com " -> " em vez de " :: ".
+Renderiza com vários navegadores em paralelo (--workers N).
+Retoma pelo manifesto.jsonl (pageId/URL -> PDF): itens prontos não abrem o navegador.
+Links /display/... são resolvidos para o pageId (tdn_canonico): a mesma página
+listada com URLs diferentes é baixada uma vez só.
+Links com pageId são impressos pelo caminho leve (export_view via REST) quando
+possível (--modo completo força a releaseview).
+--processos K divide o trabalho entre K processos (fila SQLite com arrendamento:
+um processo que cai não perde os itens); --shard i/n processa só uma fatia fixa
+da lista, para rodar em várias máquinas/invocações.
 """
 
 from pathlib import Path
-from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
-import re, csv, time, json
+import re, csv, time, json, argparse, threading
+import tdn_fila
+from tdn_canonico import chaves_canonicas
+from tdn_navegador import renderizar_em_paralelo, buscar_export_view, imprimir_export_view
+from tdn_manifesto import Manifesto, chave_de
+from tdn_espera import aguardar_estavel
 
 TXT = Path("links_organizados.txt")
 OUT = Path("PDFs_TDN")
 HEADLESS = True          # coloque False se quiser ver a janela
 PRINT_BG = True          # imprimir com fundo
-SCROLL_STEPS = 80        # aumente se as páginas forem longas
-SCROLL_WAIT_MS = 200
+WORKERS = 4              # navegadores em paralelo
+PROCESSOS = 1            # >1: processos com fila SQLite à prova de crash
+MODO_RENDER = "export"   # "export" (corpo via REST, leve) ou "completo"
+PERFIL_REDE = None       # "print-lean" bloqueia rastreadores/fonts/mídia (--perfil)
+TDN_ROOT = "https://tdn.totvs.com.br"
 
 def limpar_nome(s: str) -> str:
     if not s: return "arquivo"
@@ -40,17 +56,6 @@ def limpar_nome(s: str) -> str:
     s = re.sub(r'[\\/*?:"<>|]+', " ", s).strip()
     return s[:150] or "arquivo"
 
-def rolar_ate_fim(page):
-    last = 0
-    for _ in range(SCROLL_STEPS):
-        try:
-            page.evaluate("window.scrollBy(0, document.body.scrollHeight)")
-            page.wait_for_timeout(SCROLL_WAIT_MS)
-            h = page.evaluate("document.body.scrollHeight")
-            if h == last: break
-            last = h
-        except: break
-
 def titulo_da_pagina(page) -> str:
     try:
         t = page.title() or ""
@@ -59,10 +64,12 @@ def titulo_da_pagina(page) -> str:
     except:
         return "pagina"
 
-def salvar_pdf(page, url: str, destino: Path):
+def carregar_pagina(page, url: str):
     page.goto(url, wait_until="domcontentloaded", timeout=120_000)
-    page.wait_for_timeout(600)
-    rolar_ate_fim(page)
+    aguardar_estavel(page)      # rede + DOM quieto + imagens, com prazo
+
+def salvar_pdf(page, destino: Path):
+    # imprime a página já carregada por carregar_pagina (sem navegar de novo)
     page.pdf(path=str(destino), format="A4", print_background=PRINT_BG)
 
 def parse_linhas(txt: Path):
@@ -90,23 +97,105 @@ def parse_linhas(txt: Path):
             sec = ln.strip()
     return items
 
+_LOCK_NOMES = threading.Lock()
+_RESERVADOS = set()
+_MANIFESTO = None        # aberto em main(); nos processos trabalhadores, só leitura
+
+def _manifesto() -> Manifesto:
+    global _MANIFESTO
+    if _MANIFESTO is None:
+        _MANIFESTO = Manifesto(OUT / "manifesto.jsonl", somente_leitura=True)
+    return _MANIFESTO
+
+def ja_existente(pdf_path: Path, chave: str) -> bool:
+    """PDF com o nome natural já no disco, de uma execução anterior ao manifesto
+    (ou desta mesma chave) — não de outra página deste run, neste processo
+    ou em outro (--processos: nomes reservados na fila compartilhada)."""
+    with _LOCK_NOMES:
+        return (pdf_path.exists() and pdf_path not in _RESERVADOS
+                and not tdn_fila.reservado_global(pdf_path)
+                and _manifesto().dono(pdf_path) in (None, chave))
+
 def nome_unico(dest: Path) -> Path:
-    if not dest.exists(): return dest
-    base = dest.with_suffix("")
-    ext = dest.suffix
-    i = 2
-    while True:
-        cand = Path(f"{base} ({i}){ext}")
-        if not cand.exists(): return cand
-        i += 1
+    # sob lock: dois workers não podem escolher o mesmo nome ao mesmo tempo
+    # (entre processos, a reserva passa também pela fila compartilhada)
+    with _LOCK_NOMES:
+        cand = dest
+        i = 2
+        while cand.exists() or cand in _RESERVADOS or not tdn_fila.reservar_global(cand):
+            cand = Path(f"{dest.with_suffix('')} ({i}){dest.suffix}")
+            i += 1
+        _RESERVADOS.add(cand)
+        return cand
+
+def baixar_item(page, it):
+    """Tarefa de um worker: devolve (pdf_path, status, erro)."""
+    sec = limpar_nome(it["section"]) or "Outros"
+    pasta = OUT / sec
+    pasta.mkdir(parents=True, exist_ok=True)
+
+    url = it["url"]
+    pdf_path = None
+    err = ""
+
+    # caminho leve (só com pageId): export_view via REST num template local
+    if it.get("modo", MODO_RENDER) == "export" and it["chave"].isdigit():
+        exp = buscar_export_view(TDN_ROOT, it["chave"])
+        if exp:
+            real, corpo, space_key = exp
+            titulo = limpar_nome(real) if len(limpar_nome(real)) > 5 else limpar_nome(it["title"])
+            pdf_path = pasta / f"{titulo}.pdf"
+            if ja_existente(pdf_path, it["chave"]):
+                return pdf_path, "SKIP", ""
+            pdf_path = nome_unico(pdf_path)
+            try:
+                imprimir_export_view(page, TDN_ROOT, real, corpo, space_key, pdf_path, PRINT_BG)
+                return pdf_path, "OK", ""
+            except Exception as e:
+                err = str(e)
+
+    # uma única carga por item: nomeia pelo título real da página (melhor)
+    # e imprime o PDF dessa mesma carga
+    for tent in range(3):
+        try:
+            carregar_pagina(page, url)
+            if pdf_path is None:
+                titulo = limpar_nome(it["title"])
+                real = titulo_da_pagina(page)
+                if real and len(real) > 5:
+                    titulo = real
+                pdf_path = pasta / f"{titulo}.pdf"
+                # checa ANTES do nome_unico; depois dele o arquivo nunca existe
+                if ja_existente(pdf_path, it["chave"]):
+                    return pdf_path, "SKIP", ""
+                pdf_path = nome_unico(pdf_path)
+            salvar_pdf(page, pdf_path)
+            return pdf_path, "OK", ""
+        except Exception as e:
+            err = str(e)
+            time.sleep(0.8*(tent+1))
+    return pdf_path, "ERRO", err
 
 def main():
+    ap = argparse.ArgumentParser(description="Baixa os PDFs de links_organizados.txt em pastas por seção.")
+    ap.add_argument("--workers", type=int, default=WORKERS, help="Navegadores em paralelo.")
+    ap.add_argument("--modo", choices=["export", "completo"], default=MODO_RENDER,
+                    help="export: corpo via REST num template leve (volta ao completo se precisar de JS).")
+    ap.add_argument("--perfil", choices=["print-lean"], default=PERFIL_REDE,
+                    help="Bloqueia rastreadores, web fonts e vídeo/áudio ao renderizar.")
+    ap.add_argument("--processos", type=int, default=PROCESSOS,
+                    help="Processos de renderização (cada um com --workers navegadores).")
+    ap.add_argument("--shard", type=tdn_fila.ler_shard, default=None, metavar="i/n",
+                    help="Processa só a fatia i de n (para dividir entre máquinas/invocações).")
+    args = ap.parse_args()
+
     if not TXT.exists():
         raise FileNotFoundError("links_organizados.txt não encontrado na pasta atual.")
 
     OUT.mkdir(parents=True, exist_ok=True)
     log_csv = OUT / "log.csv"
-    status_json = OUT / "status.json"
+    sufixo = f".shard-{args.shard[0]}-{args.shard[1]}" if args.shard else ""
+    status_json = OUT / f"status{sufixo}.json"
 
     novo_log = not log_csv.exists()
     flog = log_csv.open("a", encoding="utf-8", newline="")
@@ -114,82 +203,96 @@ def main():
     if novo_log:
         wlog.writerow(["section","title","url","pdf_path","status","erro"])
 
+    global _MANIFESTO
+    _MANIFESTO = Manifesto(OUT / "manifesto.jsonl", compactar=not args.shard)
+
     items = parse_linhas(TXT)
-    total = len(items)
-    print(f"Total de links: {total}")
-
-    with sync_playwright() as pw:
-        browser = pw.chromium.launch(headless=HEADLESS)
-        ctx = browser.new_context(locale="pt-BR", viewport={"width": 1400, "height": 900})
-        page = ctx.new_page()
-        page.set_default_timeout(90_000)
-
-        start = time.time()
-        ok_count = 0
-
-        for i, it in enumerate(items, start=1):
-            sec = limpar_nome(it["section"]) or "Outros"
-            pasta = OUT / sec
-            pasta.mkdir(parents=True, exist_ok=True)
-
-            url = it["url"]
-            # tenta nomear pelo título real da página (melhor)
-            titulo = limpar_nome(it["title"])
-            try:
-                page.goto(url, wait_until="domcontentloaded", timeout=120_000)
-                page.wait_for_timeout(600)
-                rolar_ate_fim(page)
-                real = titulo_da_pagina(page)
-                if real and len(real) > 5:
-                    titulo = real
-            except PWTimeout:
-                pass
-            except Exception:
-                pass
+    print(f"Total de links: {len(items)}")
+    # chave = pageId canônico: /display/... e releaseview da mesma página
+    # viram um item só (o mapa url -> pageId fica em cache no disco)
+    chaves = chaves_canonicas(it["url"] for it in items)
+    primeiro = {}
+    unicos = []
+    for it in items:
+        it["chave"] = chaves[it["url"]]
+        if it["chave"] in primeiro:
+            wlog.writerow([limpar_nome(it["section"]) or "Outros", it["title"], it["url"], "", "SKIP",
+                           f"mesma página de {primeiro[it['chave']]}"])
+            continue
+        primeiro[it["chave"]] = it["url"]
+        unicos.append(it)
+    if len(unicos) < len(items):
+        print(f"Duplicados (mesmo pageId): {len(items)-len(unicos)} ignorados")
+    items = unicos
+    if args.shard:
+        items = [it for it in items if tdn_fila.no_shard(it["chave"], args.shard)]
+        print(f"Shard {args.shard[0]}/{args.shard[1]}: {len(items)} links")
 
-            pdf_path = pasta / f"{titulo}.pdf"
-            pdf_path = nome_unico(pdf_path)
+    # retomada: o que o manifesto já tem pronto nem chega ao navegador
+    pendentes = []
+    for it in items:
+        it["modo"] = args.modo
+        # manifestos antigos chaveavam /display/... pela URL
+        feito = _MANIFESTO.concluido(it["chave"]) or _MANIFESTO.concluido(chave_de(it["url"]))
+        if feito:
+            wlog.writerow([limpar_nome(it["section"]) or "Outros", it["title"], it["url"], feito["pdf"], "SKIP", ""])
+        else:
+            pendentes.append(it)
+    flog.flush()
+    if len(pendentes) < len(items):
+        print(f"Retomando: {len(items)-len(pendentes)} já prontos no manifesto, {len(pendentes)} a baixar")
+    total = len(pendentes)
 
-            if pdf_path.exists():
-                wlog.writerow([sec, it["title"], url, str(pdf_path), "SKIP", ""])
-                flog.flush()
-                elapsed = time.time() - start
-                rate = (i/elapsed*60) if elapsed>0 else 0.0
-                print(f"[{i}/{total}] SKIP  | {pdf_path.name} | {rate:.1f} pág/min", flush=True)
-                continue
+    start = time.time()
+    done = 0
+    ok_count = 0
 
-            ok = False; err = ""
-            for tent in range(3):
-                try:
-                    salvar_pdf(page, url, pdf_path)
-                    ok = True
-                    break
-                except Exception as e:
-                    err = str(e)
-                    time.sleep(0.8*(tent+1))
-
-            if ok:
-                ok_count += 1
-                wlog.writerow([sec, it["title"], url, str(pdf_path), "OK", ""])
-            else:
-                wlog.writerow([sec, it["title"], url, "", "ERRO", err])
+    def registrar(it, res, erro):
+        nonlocal done, ok_count
+        pdf_path, status, err = res if res else (None, "ERRO", str(erro))
+        _MANIFESTO.registrar(it["chave"], it["url"], pdf_path if status != "ERRO" else "", status)
+        sec = limpar_nome(it["section"]) or "Outros"
+        url = it["url"]
+        done += 1
+        elapsed = time.time() - start
+        rate = (done/elapsed*60) if elapsed>0 else 0.0
 
+        if status == "SKIP":
+            wlog.writerow([sec, it["title"], url, str(pdf_path), "SKIP", ""])
             flog.flush()
-            elapsed = time.time() - start
-            rate = (i/elapsed*60) if elapsed>0 else 0.0
-            rem_s = int((total - i) / rate * 60) if rate > 0 else 0
-            status_json.write_text(json.dumps({
-                "total": total, "done": i, "ok": ok_count,
-                "last": str(pdf_path if ok else url),
-                "rate_pages_per_min": round(rate, 1),
-                "eta": f"{rem_s//60:02d}:{rem_s%60:02d}"
-            }, ensure_ascii=False), encoding="utf-8")
-            print(f"[{i}/{total}] {'OK   ' if ok else 'ERRO '}| {pdf_path.name if ok else '(falha)'} | {rate:.1f} pág/min",
-                  flush=True)
-
-        ctx.close()
-        browser.close()
+            print(f"[{done}/{total}] SKIP  | {pdf_path.name} | {rate:.1f} pág/min", flush=True)
+            return
+
+        ok = status == "OK"
+        if ok:
+            ok_count += 1
+            wlog.writerow([sec, it["title"], url, str(pdf_path), "OK", ""])
+        else:
+            wlog.writerow([sec, it["title"], url, "", "ERRO", err])
+
+        flog.flush()
+        rem_s = int((total - done) / rate * 60) if rate > 0 else 0
+        status_json.write_text(json.dumps({
+            "total": total, "done": done, "ok": ok_count,
+            "last": str(pdf_path if ok else url),
+            "rate_pages_per_min": round(rate, 1),
+            "eta": f"{rem_s//60:02d}:{rem_s%60:02d}"
+        }, ensure_ascii=False), encoding="utf-8")
+        print(f"[{done}/{total}] {'OK   ' if ok else 'ERRO '}| {pdf_path.name if ok else '(falha)'} | {rate:.1f} pág/min",
+              flush=True)
+
+    if args.processos > 1:
+        # cada processo imprime o próprio resumo de bloqueio
+        tdn_fila.renderizar_em_processos(pendentes, baixar_item, registrar, args.processos,
+                                         workers=args.workers, headless=HEADLESS, perfil=args.perfil,
+                                         caminho_db=OUT / f".fila_render{sufixo}.sqlite")
+    else:
+        bloqueio = renderizar_em_paralelo(pendentes, baixar_item, registrar,
+                                          workers=args.workers, headless=HEADLESS, perfil=args.perfil)
+        if bloqueio:
+            print(bloqueio.resumo())
 
+    _MANIFESTO.fechar()
     flog.close()
     print(f"\n✅ Concluído. PDFs em: {OUT.resolve()}\n   - log: {log_csv}\n   - status: {status_json}")
 
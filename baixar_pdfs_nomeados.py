@@ -1,12 +1,11 @@
-import subprocess
-import requests
-from bs4 import BeautifulSoup
 import re
 import os
 import time
 import shutil
 from urllib.parse import urlparse, parse_qs
 from pathlib import Path
+from playwright.sync_api import sync_playwright
+from tdn_espera import aguardar_estavel
 
 # ======= CONFIG =======
 CANDIDATOS_CHROME = [
@@ -15,11 +14,9 @@ CANDIDATOS_CHROME = [
     r"C:\Program Files\Microsoft\Edge\Application\msedge.exe",
     r"C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe",
 ]
-UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-      "(KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36")
-TIMEOUT = 30
-RETRIES = 3
-SLEEP_RETRY = 2
+TIMEOUT = 120              # s de navegação por tentativa (como nos outros downloaders)
+TENTATIVAS = 3
+HEADLESS = True
 # ======================
 
 def encontrar_navegador():
@@ -53,27 +50,6 @@ def extrair_fallback_do_link(link: str) -> str:
     except Exception:
         return "pagina"
 
-def obter_titulo(link: str) -> str:
-    headers = {"User-Agent": UA, "Accept-Language": "pt-BR,pt;q=0.9"}
-    for tent in range(1, RETRIES + 1):
-        try:
-            r = requests.get(link, headers=headers, timeout=TIMEOUT)
-            if r.status_code >= 400:
-                raise requests.RequestException(f"HTTP {r.status_code}")
-            r.encoding = r.apparent_encoding or "utf-8"
-            soup = BeautifulSoup(r.text, "html.parser")
-            if soup.title and soup.title.string and soup.title.string.strip():
-                return limpar_nome(soup.title.string)
-            h1 = soup.find("h1")
-            if h1 and h1.get_text(strip=True):
-                return limpar_nome(h1.get_text(strip=True))
-            return limpar_nome(extrair_fallback_do_link(link))
-        except Exception:
-            if tent < RETRIES:
-                time.sleep(SLEEP_RETRY * tent)
-            else:
-                return limpar_nome(extrair_fallback_do_link(link))
-
 def nome_unico(caminho: Path) -> Path:
     if not caminho.exists():
         return caminho
@@ -86,30 +62,27 @@ def nome_unico(caminho: Path) -> Path:
             return cand
         i += 1
 
-def imprimir_pdf(navegador_path: str, url: str, saida_pdf: Path):
-    # Chrome/Edge headless exigem caminho ABSOLUTO no --print-to-pdf (principal correção)
-    saida_pdf = saida_pdf.resolve()
-    args = [
-        navegador_path,
-        "--headless=new",
-        "--disable-gpu",
-        "--no-sandbox",
-        "--disable-dev-shm-usage",
-        "--print-to-pdf-no-header",
-        "--disable-features=Translate,MediaRouter,OptimizationHints",
-        "--no-first-run",
-        "--virtual-time-budget=15000",
-        f"--print-to-pdf={str(saida_pdf)}",
-        url,
-    ]
-    proc = subprocess.run(args, capture_output=True, text=True)
-    if proc.returncode != 0 or not saida_pdf.exists():
-        raise RuntimeError(f"Falha ao gerar PDF. STDERR: {proc.stderr}")
+def titulo_da_pagina(page, link: str) -> str:
+    # título da mesma carga que vai para o PDF (sem baixar a página de novo)
+    try:
+        t = page.title().strip()
+        if not t:
+            t = page.evaluate("() => { const h = document.querySelector('h1'); return h ? h.innerText.trim() : ''; }")
+        if t:
+            return limpar_nome(t)
+    except Exception:
+        pass
+    return limpar_nome(extrair_fallback_do_link(link))
+
+def carregar(page, url: str):
+    page.goto(url, wait_until="domcontentloaded", timeout=TIMEOUT * 1000)
+    aguardar_estavel(page)      # espera o quanto a página precisa, não 15s fixos
 
-def main():
-    navegador = encontrar_navegador()
-    print(f"➡️ Usando navegador: {navegador}")
+def imprimir_pdf(page, saida_pdf: Path):
+    # imprime a página já carregada; sem cabeçalho/rodapé, como o --print-to-pdf-no-header
+    page.pdf(path=str(saida_pdf.resolve()), display_header_footer=False)
 
+def main():
     links_path = Path("links.txt").resolve()
     if not links_path.exists():
         raise FileNotFoundError("Arquivo 'links.txt' não encontrado na pasta atual.")
@@ -124,24 +97,60 @@ def main():
     out_dir = Path(__file__).parent.resolve() / "PDFs"
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    for idx, link in enumerate(links, start=1):
-        print(f"\n[{idx}/{len(links)}] Processando: {link}")
-        titulo = obter_titulo(link)
-        nome_pdf = f"{titulo}.pdf"
-        destino = nome_unico(out_dir / nome_pdf)
-
-        try:
-            imprimir_pdf(navegador, link, destino)
-            print(f"✅ PDF gerado: {destino}")
-        except Exception as e:
-            print(f"⚠️ Erro ao gerar com título '{titulo}': {e}")
-            fallback = limpar_nome(extrair_fallback_do_link(link)) + ".pdf"
-            destino_fb = nome_unico(out_dir / fallback)
+    # um único navegador para todos os links (antes: um Chrome por link)
+    try:
+        navegador = encontrar_navegador()
+    except FileNotFoundError:
+        navegador = None        # usa o Chromium do Playwright
+    print(f"➡️ Usando navegador: {navegador or 'Chromium (Playwright)'}")
+
+    with sync_playwright() as pw:
+        browser = pw.chromium.launch(headless=HEADLESS, executable_path=navegador,
+                                     args=["--disable-gpu", "--disable-dev-shm-usage",
+                                           "--disable-features=Translate,MediaRouter,OptimizationHints"])
+        ctx = browser.new_context(locale="pt-BR", extra_http_headers={"Accept-Language": "pt-BR,pt;q=0.9"})
+        page = ctx.new_page()
+
+        for idx, link in enumerate(links, start=1):
+            print(f"\n[{idx}/{len(links)}] Processando: {link}")
+            if page.is_closed():
+                page = ctx.new_page()
+            carregou, erro = False, None
+            for tent in range(TENTATIVAS):
+                try:
+                    carregar(page, link)
+                    carregou = True
+                    break
+                except Exception as e:
+                    erro = e
+                    print(f"⚠️ Tentativa {tent + 1}/{TENTATIVAS} falhou ao carregar: {e}")
+                    if page.is_closed():
+                        page = ctx.new_page()
+                    time.sleep(0.8 * (tent + 1))
+            if not carregou:
+                # a aba pode estar no link anterior ou numa página de erro:
+                # nunca imprime um documento que não é deste link
+                print(f"❌ Falha final neste link: {erro}")
+                continue
+            titulo = titulo_da_pagina(page, link)
+            nome_pdf = f"{titulo}.pdf"
+            destino = nome_unico(out_dir / nome_pdf)
+
             try:
-                imprimir_pdf(navegador, link, destino_fb)
-                print(f"✅ PDF gerado (fallback): {destino_fb}")
-            except Exception as e2:
-                print(f"❌ Falha final neste link: {e2}")
+                imprimir_pdf(page, destino)
+                print(f"✅ PDF gerado: {destino}")
+            except Exception as e:
+                print(f"⚠️ Erro ao gerar com título '{titulo}': {e}")
+                fallback = limpar_nome(extrair_fallback_do_link(link)) + ".pdf"
+                destino_fb = nome_unico(out_dir / fallback)
+                try:
+                    imprimir_pdf(page, destino_fb)
+                    print(f"✅ PDF gerado (fallback): {destino_fb}")
+                except Exception as e2:
+                    print(f"❌ Falha final neste link: {e2}")
+
+        ctx.close()
+        browser.close()
 
 if __name__ == "__main__":
     main()
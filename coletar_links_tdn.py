@@ -5,8 +5,8 @@ import html
 import urllib.parse as up
 from pathlib import Path
 
-import requests
 from bs4 import BeautifulSoup
+import tdn_api
 
 # >>> COLOQUE AQUI O LINK DA PÁGINA DO PRINT (página-índice) <<<
 SEED_URL = "https://tdn.totvs.com.br/display/public/LDT/MCF+-+Configurador+de+Produtos"
@@ -52,18 +52,52 @@ def passa_filtro(path: str) -> bool:
         return False
     return any(p.search(path) for p in PADROES_OK)
 
-def coletar_links(seed: str):
-    print(f"Coletando links em: {seed}")
+# Sinais de que o HTML estático está incompleto e a página precisa de JS
+SELETORES_JS = [
+    ".plugin_pagetree",                 # macro pagetree: filhos vêm por AJAX
+    ".plugin_pagetree_children_container",
+    "[data-macro-name=pagetree]",
+    "[data-macro-name=livesearch]",
+    "[data-macro-name=contentbylabel]",
+]
+
+def baixar_html(url: str):
+    """GET estático da página; devolve o BeautifulSoup."""
     headers = {"User-Agent": UA, "Accept-Language": "pt-BR,pt;q=0.9"}
-    r = requests.get(seed, headers=headers, timeout=60)
+    r = tdn_api.get(url, headers=headers, timeout=60)
     r.raise_for_status()
     r.encoding = r.apparent_encoding or "utf-8"
-    soup = BeautifulSoup(r.text, "html.parser")
-
+    return BeautifulSoup(r.text, "html.parser")
+
+def precisa_js(soup) -> bool:
+    """
+    True quando o HTML servido não tem os links que o navegador mostraria:
+    pagetree/listas carregadas por AJAX ainda vazias, controles de expandir
+    cujo conteúdo não veio no HTML, iframes do próprio TDN ou página sem corpo.
+    """
+    # só o corpo da página conta: a árvore lateral do tema sempre vem por AJAX
+    corpo = soup.select_one("#main-content, .wiki-content, #content")
+    if corpo is None:
+        return True
+    for sel in SELETORES_JS:
+        for el in corpo.select(sel):
+            if not el.find("a", href=True):
+                return True
+    for ctl in corpo.select('[aria-expanded="false"][aria-controls]'):
+        alvo = soup.find(id=ctl["aria-controls"])
+        if alvo is None or not alvo.get_text(strip=True):
+            return True
+    for fr in corpo.find_all("iframe", src=True):
+        if eh_do_tdn(absoluto(f"https://{DOMINIO}/", fr["src"])):
+            return True
+    return False
+
+def extrair_links(soup, base: str):
+    """(url, texto) das âncoras que passam nos filtros, sem repetição, na ordem da página."""
     links = []
     for a in soup.find_all("a", href=True):
         href = a.get("href").strip()
-        url_abs = absoluto(seed, href)
+        url_abs = absoluto(base, href)
         url_norm = normalizar(url_abs)
 
         if not eh_do_tdn(url_norm):
@@ -82,6 +116,14 @@ def coletar_links(seed: str):
             uniq.append((url, txt))
             seen.add(url)
 
+    return uniq
+
+def coletar_links(seed: str):
+    print(f"Coletando links em: {seed}")
+    soup = baixar_html(seed)
+    uniq = extrair_links(soup, seed)
+    if precisa_js(soup):
+        print("⚠️ A página parece carregar parte dos links via JS; use coletar_links_tdn_recursivo.py para a versão renderizada.")
     print(f"Encontrados {len(uniq)} links após filtros.")
     return uniq
 
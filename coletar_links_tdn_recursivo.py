@@ -1,19 +1,23 @@
 # -*- coding: utf-8 -*-
 from pathlib import Path
-from collections import deque
-from playwright.sync_api import sync_playwright
 import urllib.parse as up
-import csv, re, html, time, sys, json
+import csv, re, html, time, json, heapq, argparse, threading
+from tdn_espera import aguardar_estavel
+from tdn_navegador import pool_navegadores, expandir_e_coletar
+from coletar_links_tdn import baixar_html, precisa_js, extrair_links
+import tdn_canonico
 
 # >>> COLOQUE AQUI A PÁGINA-ÍNDICE (a do print)
 SEED_URL = "https://tdn.totvs.com.br/display/public/LDT/MCF+-+Configurador+de+Produtos"
 
 HEADLESS = True           # Coloque False para ver a janela
+PERFIL_REDE = "crawl"     # só document/XHR/script (None = carrega tudo)
 DOMINIO = "tdn.totvs.com.br"
 MAX_DEPTH = 3             # Níveis de recursão em /display/... (aumente se precisar)
-WAIT_MS = 600             # pausas entre ações
-SCROLL_STEPS = 60
-SCROLL_WAIT_MS = 250
+WORKERS = 4               # páginas visitando em paralelo (um navegador cada)
+MAX_POR_HOST = 4          # páginas abrindo ao mesmo tempo no mesmo host
+ATRASO_HOST_S = 0.5       # intervalo mínimo entre inícios de carga no mesmo host
+MODO_COLETA = "hibrido"   # "hibrido": HTML estático primeiro, navegador só se precisar de JS; "render": sempre navegador
 
 PADROES_OK = [
     re.compile(r"^/pages/releaseview\.action\?pageId=\d+$"),  # páginas de conteúdo
@@ -51,71 +55,27 @@ def limpar_nome(s: str) -> str:
     s = re.sub(r"\s{2,}", " ", s)
     return s[:120] or "Sem Título"
 
-def expandir_tudo_context(ctx):
-    # abre <details>
-    try:
-        ctx.evaluate("""() => { for (const d of document.querySelectorAll('details')) d.open = true; }""")
-    except: pass
-    seletores = [
-        'button[aria-expanded="false"]',
-        '[role="button"][aria-expanded="false"]',
-        'a[aria-expanded="false"]',
-        'button:has-text("Expandir")',
-        'a:has-text("Expandir")',
-        '.plugin_pagetree_expand_all',
-        '.expand-control',
-        '.aui-button[aria-expanded="false"]',
-        '.pagetree-toggle',
-        '.plugin_pagetree_child_toggle',
-    ]
-    for _ in range(8):
-        clicou = False
-        for sel in seletores:
-            try:
-                loc = ctx.locator(sel)
-                n = loc.count()
-            except:
-                n = 0
-            for i in range(n):
-                try:
-                    loc.nth(i).click(force=True, timeout=500)
-                    clicou = True
-                except:
-                    pass
-        ctx.wait_for_timeout(WAIT_MS)
-        if not clicou: break
-
-def rolar_ate_fim(ctx):
-    last_h = 0
-    for _ in range(SCROLL_STEPS):
-        try:
-            ctx.evaluate("window.scrollBy(0, document.body.scrollHeight);")
-            ctx.wait_for_timeout(SCROLL_WAIT_MS)
-            h = ctx.evaluate("document.body.scrollHeight")
-            if h == last_h:
-                break
-            last_h = h
-        except:
-            break
+SELETORES_EXPANDIR = [
+    'button[aria-expanded="false"]',
+    '[role="button"][aria-expanded="false"]',
+    'a[aria-expanded="false"]',
+    'button:has-text("Expandir")',
+    'a:has-text("Expandir")',
+    '.plugin_pagetree_expand_all',
+    '.expand-control',
+    '.aui-button[aria-expanded="false"]',
+    '.pagetree-toggle',
+    '.plugin_pagetree_child_toggle',
+]
 
 def coletar_anchors_ctx(ctx):
-    pares = []
-    try:
-        pares = ctx.eval_on_selector_all(
-            "a[href]",
-            "els => els.map(a => [a.href, (a.textContent||'').trim()])"
-        )
-    except: pass
+    # expande e filtra/deduplica no próprio navegador (uma chamada evaluate);
+    # aqui só a normalização final, sobre os links que já passaram no filtro
     out = []
     vistos = set()
-    for href, txt in pares:
+    for href, txt in expandir_e_coletar(ctx, SELETORES_EXPANDIR, PADROES_OK, PADROES_SKIP, DOMINIO):
         url = normalizar(href)
-        if not eh_do_tdn(url): 
-            continue
-        path = up.urlsplit(url).path
-        if not passa_filtro(path):
-            continue
-        if url in vistos: 
+        if url in vistos:
             continue
         vistos.add(url)
         out.append((url, txt))
@@ -141,10 +101,8 @@ def breadcrumbs_ctx(ctx):
     return []
 
 def coletar_em_pagina(page, url):
-    """Coleta (links, seção) na página atual + iframes"""
-    expandir_tudo_context(page)
-    rolar_ate_fim(page)
-    expandir_tudo_context(page)
+    """Coleta (seção, links, pageId) na página atual + iframes"""
+    links = coletar_anchors_ctx(page)       # expande tudo antes de coletar
 
     # breadcrumbs -> seção
     bc = breadcrumbs_ctx(page)
@@ -159,93 +117,290 @@ def coletar_em_pagina(page, url):
             sec = "Outros"
     sec = limpar_nome(sec)
 
-    links = coletar_anchors_ctx(page)
-
     # também coleta de iframes
     try:
         for fr in page.frames:
             if fr == page.main_frame: 
                 continue
             try:
-                expandir_tudo_context(fr)
-                rolar_ate_fim(fr)
+                aguardar_estavel(fr)
                 links += coletar_anchors_ctx(fr)
             except:
                 pass
     except:
         pass
 
-    return sec, links
+    try:
+        pid = page.get_attribute('meta[name="ajs-page-id"]', "content", timeout=1000)
+    except:
+        pid = None
+    return sec, links, pid
+
+class Fronteira:
+    """
+    Fronteira BFS compartilhada pelos workers: sai sempre a menor profundidade
+    (depois a ordem de chegada). proximo() bloqueia enquanto a fila está vazia
+    mas ainda há páginas em voo (que podem enfileirar mais); devolve None quando
+    não há mais nada a fazer.
+    """
+    def __init__(self, itens=()):
+        self._heap = []
+        self._seq = 0
+        self._em_voo = 0
+        self._cond = threading.Condition()
+        for url, depth in itens:
+            self.adicionar(url, depth)
+
+    def adicionar(self, url, depth):
+        with self._cond:
+            heapq.heappush(self._heap, (depth, self._seq, url))
+            self._seq += 1
+            self._cond.notify()
+
+    def proximo(self):
+        with self._cond:
+            while not self._heap and self._em_voo:
+                self._cond.wait()
+            if not self._heap:
+                self._cond.notify_all()     # acorda os outros workers para saírem
+                return None
+            depth, _, url = heapq.heappop(self._heap)
+            self._em_voo += 1
+            return url, depth
+
+    def concluir(self):
+        with self._cond:
+            self._em_voo -= 1
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._heap)
+
+class Cortesia:
+    """Limite de páginas simultâneas e intervalo mínimo entre cargas, por host."""
+    def __init__(self, max_por_host=MAX_POR_HOST, atraso_s=ATRASO_HOST_S):
+        self.max_por_host = max_por_host
+        self.atraso_s = atraso_s
+        self._lock = threading.Lock()
+        self._sems = {}
+        self._proximo_inicio = {}
+
+    def entrar(self, host):
+        with self._lock:
+            sem = self._sems.setdefault(host, threading.BoundedSemaphore(self.max_por_host))
+        sem.acquire()
+        with self._lock:
+            agora = time.monotonic()
+            inicio = max(agora, self._proximo_inicio.get(host, 0.0))
+            self._proximo_inicio[host] = inicio + self.atraso_s
+        time.sleep(inicio - agora)
+
+    def sair(self, host):
+        self._sems[host].release()
+
+class Diario:
+    """
+    Journal append-only (JSONL) do crawl: uma linha por evento
+      {"t":"fila","url","depth"}   URL enfileirada
+      {"t":"link","section","title_hint","url"}   link coletado
+      {"t":"visitado","url"}       página processada (gravado DEPOIS dos
+                                   links/enfileiramentos dela)
+    Na retomada, a fila é a das URLs enfileiradas e ainda não visitadas, na
+    mesma ordem; uma página interrompida no meio é refeita do zero.
+    Linhas truncadas (kill no meio da escrita) são ignoradas.
+    """
+    def __init__(self, caminho: Path):
+        self.caminho = caminho
+        self.visited = set()
+        self.enfileirados = {}     # url -> depth (ordem de inserção = ordem da fila)
+        self.resultados = []       # dicts: {section, title_hint, url}
+        if caminho.exists():
+            with caminho.open("r", encoding="utf-8") as f:
+                for ln in f:
+                    try:
+                        ev = json.loads(ln)
+                    except ValueError:
+                        continue
+                    t = ev.pop("t", None)
+                    if t == "fila":
+                        self.enfileirados.setdefault(ev["url"], ev["depth"])
+                    elif t == "link":
+                        self.resultados.append(ev)
+                    elif t == "visitado":
+                        self.visited.add(ev["url"])
+        self._f = caminho.open("a", encoding="utf-8")
+        if caminho.stat().st_size and not caminho.read_bytes().endswith(b"\n"):
+            self._f.write("\n")   # fecha a linha truncada para não colar na próxima
+
+    def _gravar(self, ev):
+        self._f.write(json.dumps(ev, ensure_ascii=False) + "\n")
+
+    def enfileirar(self, url, depth) -> bool:
+        if url in self.enfileirados:
+            return False
+        self.enfileirados[url] = depth
+        self._gravar({"t": "fila", "url": url, "depth": depth})
+        return True
+
+    def link(self, r):
+        self.resultados.append(r)
+        self._gravar(dict(t="link", **r))
+
+    def visitar(self, url):
+        self.visited.add(url)
+        self._gravar({"t": "visitado", "url": url})
+        self._f.flush()
+
+    def pendentes(self):
+        return [(u, d) for u, d in self.enfileirados.items() if u not in self.visited]
+
+    def fechar(self):
+        self._f.close()
+
+def coletar_estatico(url):
+    """
+    (seção, links, pageId) a partir do HTML servido, sem navegador; None quando o
+    GET falha ou a página depende de JS (pagetree/expand vazios, iframes...).
+    """
+    try:
+        soup = baixar_html(url)
+    except Exception:
+        return None
+    if precisa_js(soup):
+        return None
+    # breadcrumbs -> seção (mesma regra da versão renderizada)
+    bc = []
+    for sel in ('nav[aria-label="breadcrumbs"]', '.breadcrumbs', '.aui-nav-breadcrumbs', '#breadcrumbs'):
+        bc = [t for t in (e.get_text(strip=True) for e in soup.select(sel + " a, " + sel + " span"))
+              if t and t not in ("Páginas", "Pages", "…", "...")]
+        if bc:
+            break
+    if bc:
+        sec = " / ".join(bc[-2:]) if len(bc) >= 2 else bc[-1]
+    else:
+        h1 = soup.find("h1")
+        sec = h1.get_text(strip=True) if h1 else "Outros"
+    links = [(u, t) for u, t in extrair_links(soup, url) if passa_filtro(up.urlsplit(u).path)]
+    meta = soup.find("meta", attrs={"name": "ajs-page-id"})
+    return limpar_nome(sec), links, meta.get("content") if meta else None
 
 def main():
     out_txt  = Path("links.txt")
     out_csv  = Path("links.csv")
-    cache    = Path(".visited.json")
+    cache    = Path(".visited.json")          # formato antigo (só visitados)
+    journal  = Path(".crawl_journal.jsonl")
 
-    seed = SEED_URL
-    if len(sys.argv) > 1:
-        seed = sys.argv[1]
+    ap = argparse.ArgumentParser(description="Coleta recursiva (BFS) de links do TDN a partir de uma página-índice.")
+    ap.add_argument("seed", nargs="?", default=SEED_URL)
+    ap.add_argument("--workers", type=int, default=WORKERS, help="Páginas visitando em paralelo.")
+    ap.add_argument("--max-depth", type=int, default=MAX_DEPTH, help="Níveis de recursão em /display/...")
+    ap.add_argument("--por-host", type=int, default=MAX_POR_HOST, help="Cargas simultâneas por host.")
+    ap.add_argument("--atraso", type=float, default=ATRASO_HOST_S, help="Segundos entre cargas no mesmo host.")
+    ap.add_argument("--modo", choices=["hibrido", "render"], default=MODO_COLETA,
+                    help="hibrido: HTML estático primeiro e navegador só quando a página precisa de JS.")
+    args = ap.parse_args()
+    seed = args.seed
 
-    # cache de visitados para retomar
-    visited = set()
-    if cache.exists():
+    retomando = journal.exists()
+    diario = Diario(journal)
+    if not retomando and cache.exists():
+        # migra o cache antigo: essas páginas não são visitadas de novo
         try:
-            visited = set(json.loads(cache.read_text(encoding="utf-8")))
+            for u in json.loads(cache.read_text(encoding="utf-8")):
+                diario.visitar(u)
         except:
-            visited = set()
-
-    fila = deque([(seed, 0)])
-    resultados = []  # dicts: {section, title_hint, url}
-    vistos_links = set()  # para dedupe de saída
+            pass
+    diario.enfileirar(seed, 0)
+    fila = Fronteira(diario.pendentes())
+    visited = diario.visited
+    resultados = diario.resultados
+    # dedupe pelo pageId canônico (/display/... e releaseview da mesma página
+    # contam uma vez só); na retomada, só o mapa local, sem rede
+    vistos_links = {tdn_canonico.chave_canonica(r["url"], rede=False) for r in resultados}
+    paginas_vistas = {tdn_canonico.chave_canonica(u, rede=False) for u in visited}
+    if retomando:
+        print(f"Retomando {journal}: {len(visited)} visitadas, {len(fila)} na fila, "
+              f"{len(resultados)} links (apague o arquivo para recomeçar)")
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=HEADLESS)
-        ctx = browser.new_context(locale="pt-BR")
-        page = ctx.new_page()
-        page.set_default_timeout(90_000)
+    # links.csv é gravado conforme os links aparecem; na retomada é refeito
+    # a partir do journal (que pode estar à frente do CSV) e segue em append
+    fcsv = out_csv.open("w", encoding="utf-8", newline="")
+    wcsv = csv.DictWriter(fcsv, fieldnames=["section","title_hint","url"])
+    wcsv.writeheader()
+    wcsv.writerows(resultados)
+    fcsv.flush()
 
-        while fila:
-            url, depth = fila.popleft()
-            if url in visited:
-                continue
-            visited.add(url)
-            cache.write_text(json.dumps(list(visited)), encoding="utf-8")
+    cortesia = Cortesia(args.por_host, args.atraso)
+    vias = {"estatico": 0, "render": 0}
 
-            try:
+    def visitar(page, item):
+        url, depth = item
+        host = up.urlsplit(url).netloc
+        cortesia.entrar(host)
+        try:
+            res, via = (coletar_estatico(url), "estatico") if args.modo == "hibrido" else (None, None)
+            if not res:
                 page.goto(url, wait_until="domcontentloaded")
-                page.wait_for_timeout(WAIT_MS)
-            except Exception as e:
-                print(f"[ERRO] não abriu: {url} | {e}")
-                continue
+                aguardar_estavel(page)
+        finally:
+            cortesia.sair(host)
+        if not res:
+            res, via = coletar_em_pagina(page, url), "render"
+        sec, links, pid = res
+        tdn_canonico.registrar(url, pid)
+        # resolve as chaves aqui, fora do lock do pool (REST em paralelo, com cache)
+        chaves = tdn_canonico.chaves_canonicas(u for u, _ in links)
+        return sec, [(u, txt, chaves[u]) for u, txt in links], pid or tdn_canonico.chave_canonica(url), via
 
-            sec, links = coletar_em_pagina(page, url)
-            # registra links desta página
-            for u, txt in links:
-                if u in vistos_links:
-                    continue
-                vistos_links.add(u)
-                title_hint = limpar_nome(txt) or "Sem Título"
-                resultados.append({"section": sec, "title_hint": title_hint, "url": u})
+    def registrar(item, res, erro):
+        # roda sob o lock do pool: journal, CSV e dedupe sem corrida entre workers
+        url, depth = item
+        try:
+            if erro is not None:
+                print(f"[ERRO] não abriu: {url} | {erro}")
+            else:
+                sec, links, chave_pagina, via = res
+                vias[via] += 1
+                if chave_pagina in paginas_vistas:
+                    links = []          # mesma página já visitada por outra URL
+                paginas_vistas.add(chave_pagina)
+                # registra links desta página
+                for u, txt, chave in links:
+                    if chave in vistos_links:
+                        continue
+                    vistos_links.add(chave)
+                    title_hint = limpar_nome(txt) or "Sem Título"
+                    r = {"section": sec, "title_hint": title_hint, "url": u}
 
-                # se for página índice /display/... e ainda dentro do limite, enfileira pra visitar
-                path = up.urlsplit(u).path
-                if depth < MAX_DEPTH and path.startswith("/display/"):
-                    fila.append((u, depth + 1))
+                    # se for página índice /display/... e ainda dentro do limite, enfileira pra visitar.
+                    # "fila" vai para o journal ANTES do "link": um link no disco
+                    # (que na retomada já conta como visto) sempre tem a entrada
+                    # na fila junto, mesmo que o kill pegue o buffer pela metade
+                    path = up.urlsplit(u).path
+                    if depth < args.max_depth and path.startswith("/display/") and diario.enfileirar(u, depth + 1):
+                        fila.adicionar(u, depth + 1)
+                    diario.link(r)
+                    wcsv.writerow(r)
+                fcsv.flush()
+            # só agora a página conta como visitada: um kill antes disso a refaz
+            diario.visitar(url)
+            print(f"[{len(visited)} visitadas | {len(fila)} na fila | {len(resultados)} links] {url}", flush=True)
+        finally:
+            fila.concluir()
 
-        ctx.close()
-        browser.close()
+    bloqueio = pool_navegadores(fila.proximo, visitar, registrar, workers=args.workers,
+                                headless=HEADLESS, perfil=PERFIL_REDE)
+    if bloqueio:
+        print(bloqueio.resumo())
+    print(f"Páginas via HTML estático: {vias['estatico']} | via navegador: {vias['render']}")
+    diario.fechar()
+    fcsv.close()
 
     # salva saídas
     with out_txt.open("w", encoding="utf-8") as f:
         for r in resultados:
             f.write(r["url"] + "\n")
 
-    with out_csv.open("w", encoding="utf-8", newline="") as f:
-        w = csv.DictWriter(f, fieldnames=["section","title_hint","url"])
-        w.writeheader()
-        for r in resultados:
-            w.writerow(r)
-
     print(f"✅ Coletados {len(resultados)} links.")
     print(f"   - {out_txt}")
     print(f"   - {out_csv}")
@@ -4,14 +4,16 @@ import re
 import html
 import urllib.parse as up
 from playwright.sync_api import sync_playwright
+from tdn_espera import aguardar_estavel
+from tdn_navegador import aplicar_perfil, expandir_e_coletar
+from tdn_canonico import chaves_canonicas
 
 # >>> COLE AQUI O LINK-ÍNDICE (o do seu print)
 SEED_URL = "https://tdn.totvs.com.br/display/public/LDT/MCF+-+Configurador+de+Produtos"
 
 # Configs
 HEADLESS = True          # Coloque False para ver a janela abrindo
-SCROLL_STEPS = 30        # Quantidade de rolagens até o fim
-SCROLL_WAIT_MS = 300     # Espera entre rolagens (ms)
+PERFIL_REDE = "crawl"    # só document/XHR/script (None = carrega tudo)
 MAX_EXPAND_PASSES = 6    # Quantas “varridas” de expandir faremos
 
 DOMINIO = "tdn.totvs.com.br"
@@ -46,71 +48,30 @@ def passa_filtro(path: str) -> bool:
         return False
     return any(p.search(path) for p in PADROES_OK)
 
-def expandir_tudo(page):
-    # Abre elementos <details>
-    page.evaluate("""() => {
-        for (const d of document.querySelectorAll('details')) d.open = true;
-    }""")
-
-    # Tenta clicar em botões/links de expandir (várias tentativas/seletores)
-    seletores = [
-        'button[aria-expanded="false"]',
-        '[role="button"][aria-expanded="false"]',
-        'a[aria-expanded="false"]',
-        'button:has-text("Expandir")',
-        'a:has-text("Expandir")',
-        '.expand-control',                     # comum em Confluence
-        '.plugin_pagetree_expand_all',         # árvores antigas
-        '.aui-button[aria-expanded="false"]',
-        'span[role="button"][aria-expanded="false"]',
-    ]
-    for _ in range(MAX_EXPAND_PASSES):
-        clicou_algo = False
-        for sel in seletores:
-            loc = page.locator(sel)
-            count = 0
-            try:
-                count = loc.count()
-            except:
-                pass
-            for i in range(count):
-                try:
-                    loc.nth(i).click(force=True, timeout=500)
-                    clicou_algo = True
-                except:
-                    pass
-        # dar um tempo pra carregar filhos
-        page.wait_for_timeout(600)
-        if not clicou_algo:
-            break
-
-def rolar_ate_fim(page):
-    last_height = 0
-    for _ in range(SCROLL_STEPS):
-        page.evaluate("window.scrollBy(0, document.body.scrollHeight);")
-        page.wait_for_timeout(SCROLL_WAIT_MS)
-        new_height = page.evaluate("document.body.scrollHeight")
-        if new_height == last_height:
-            break
-        last_height = new_height
+SELETORES_EXPANDIR = [
+    'button[aria-expanded="false"]',
+    '[role="button"][aria-expanded="false"]',
+    'a[aria-expanded="false"]',
+    'button:has-text("Expandir")',
+    'a:has-text("Expandir")',
+    '.expand-control',                     # comum em Confluence
+    '.plugin_pagetree_expand_all',         # árvores antigas
+    '.aui-button[aria-expanded="false"]',
+    'span[role="button"][aria-expanded="false"]',
+]
 
 def coletar_anchors(page):
-    pares = page.eval_on_selector_all(
-        "a[href]",
-        "els => els.map(a => [a.href, (a.textContent||'').trim()])"
-    )
-    # normaliza, filtra domínio e padrões
+    # expande e filtra no próprio navegador (uma chamada só); aqui só normaliza
+    pares = expandir_e_coletar(page, SELETORES_EXPANDIR, PADROES_OK, PADROES_SKIP, DOMINIO,
+                               passadas=MAX_EXPAND_PASSES)
+    pares = [(normalizar(href), txt) for href, txt in pares]
+    # dedupe pelo pageId: /display/... e releaseview da mesma página contam uma vez
+    chaves = chaves_canonicas(url for url, _ in pares)
     vistos = set()
     uniq = []
-    for href, txt in pares:
-        url = normalizar(href)
-        if not eh_do_tdn(url):
-            continue
-        path = up.urlsplit(url).path
-        if not passa_filtro(path):
-            continue
-        if url not in vistos:
-            vistos.add(url)
+    for url, txt in pares:
+        if chaves[url] not in vistos:
+            vistos.add(chaves[url])
             uniq.append((url, txt))
     return uniq
 
@@ -134,15 +95,11 @@ def main():
         ctx = browser.new_context(locale="pt-BR", user_agent=(
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
             "(KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"))
+        bloqueio = aplicar_perfil(ctx, PERFIL_REDE) if PERFIL_REDE else None
         page = ctx.new_page()
         page.goto(SEED_URL, wait_until="domcontentloaded", timeout=120_000)
-        # dá tempo pra scripts da página
-        page.wait_for_timeout(1200)
-
-        expandir_tudo(page)
-        rolar_ate_fim(page)          # garante carregamento lazy
-        expandir_tudo(page)          # mais uma varrida após rolagem
-        rolar_ate_fim(page)
+        # espera os scripts da página assentarem (rede + DOM quieto)
+        aguardar_estavel(page)
 
         pares = coletar_anchors(page)
         salvar(pares, outdir)
@@ -150,6 +107,8 @@ def main():
         print(f"✅ Links coletados: {len(pares)}")
         print(f"   - {outdir / 'links.txt'}")
         print(f"   - {outdir / 'links.csv'}")
+        if bloqueio:
+            print(bloqueio.resumo())
 
         ctx.close()
         browser.close()
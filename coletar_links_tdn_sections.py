@@ -6,11 +6,15 @@ import html
 import sys
 import urllib.parse as up
 from playwright.sync_api import sync_playwright
+from tdn_espera import aguardar_estavel
+from tdn_navegador import aplicar_perfil, expandir_e_coletar
+from tdn_canonico import chaves_canonicas
 
 # >>> COLE AQUI O LINK ÍNDICE
 SEED_URL = "https://tdn.totvs.com.br/display/public/LDT/MCF+-+Configurador+de+Produtos"
 
 HEADLESS = True   # coloque False para ver a janela
+PERFIL_REDE = "crawl" # só document/XHR/script (None = carrega tudo)
 DOMINIO = "tdn.totvs.com.br"
 
 # filtros
@@ -50,47 +54,20 @@ def limpar_nome(nome: str) -> str:
     nome = re.sub(r"\s{2,}", " ", nome)
     return nome[:120].strip() or "Sem Título"
 
+SELETORES_EXPANDIR = [
+    'button[aria-expanded="false"]',
+    '[role="button"][aria-expanded="false"]',
+    'a[aria-expanded="false"]',
+    'button:has-text("Expandir")',
+    'a:has-text("Expandir")',
+    '.plugin_pagetree_expand_all',
+    '.expand-control',
+    '.aui-button[aria-expanded="false"]',
+]
+
 def expandir_tudo(page):
-    # abre <details>
-    page.evaluate("""() => { for (const d of document.querySelectorAll('details')) d.open = true; }""")
-    # tenta clicar em possíveis botões de expandir várias vezes
-    seletores = [
-        'button[aria-expanded="false"]',
-        '[role="button"][aria-expanded="false"]',
-        'a[aria-expanded="false"]',
-        'button:has-text("Expandir")',
-        'a:has-text("Expandir")',
-        '.plugin_pagetree_expand_all',
-        '.expand-control',
-        '.aui-button[aria-expanded="false"]',
-    ]
-    for _ in range(5):
-        clicou = False
-        for sel in seletores:
-            loc = page.locator(sel)
-            try:
-                count = loc.count()
-            except:
-                count = 0
-            for i in range(count):
-                try:
-                    loc.nth(i).click(force=True, timeout=400)
-                    clicou = True
-                except:
-                    pass
-        page.wait_for_timeout(500)
-        if not clicou:
-            break
-
-def rolar_ate_fim(page):
-    last_h = 0
-    for _ in range(40):
-        page.evaluate("window.scrollBy(0, document.body.scrollHeight);")
-        page.wait_for_timeout(250)
-        h = page.evaluate("document.body.scrollHeight")
-        if h == last_h:
-            break
-        last_h = h
+    # todos os cliques numa única chamada evaluate, até o DOM parar de mudar
+    expandir_e_coletar(page, SELETORES_EXPANDIR, coletar=False, passadas=5)
 
 def coletar_por_secao(page):
     """
@@ -143,21 +120,17 @@ def main():
         ctx = browser.new_context(locale="pt-BR", user_agent=(
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
             "(KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"))
+        bloqueio = aplicar_perfil(ctx, PERFIL_REDE) if PERFIL_REDE else None
         page = ctx.new_page()
         page.set_default_timeout(60_000)
         page.goto(SEED_URL, wait_until="domcontentloaded")
-        page.wait_for_timeout(1200)
+        aguardar_estavel(page)
 
-        expandir_tudo(page)
-        rolar_ate_fim(page)
         expandir_tudo(page)
 
         blocos = coletar_por_secao(page)
 
-        vistos = set()
-        rows = []
-        flat_urls = []
-
+        candidatos = []
         for sec, links in blocos:
             sec_limpa = limpar_nome(sec)
             for (titulo, href) in links:
@@ -167,12 +140,20 @@ def main():
                 path = up.urlsplit(url).path
                 if not passa_filtro(path):
                     continue
-                if url in vistos:
-                    continue
-                vistos.add(url)
-                titulo_limpo = limpar_nome(titulo) or "Sem Título"
-                rows.append({"section": sec_limpa, "title_hint": titulo_limpo, "url": url})
-                flat_urls.append(url)
+                candidatos.append((sec_limpa, titulo, url))
+
+        # dedupe pelo pageId: /display/... e releaseview da mesma página contam uma vez
+        chaves = chaves_canonicas(url for _, _, url in candidatos)
+        vistos = set()
+        rows = []
+        flat_urls = []
+        for sec_limpa, titulo, url in candidatos:
+            if chaves[url] in vistos:
+                continue
+            vistos.add(chaves[url])
+            titulo_limpo = limpar_nome(titulo) or "Sem Título"
+            rows.append({"section": sec_limpa, "title_hint": titulo_limpo, "url": url})
+            flat_urls.append(url)
 
         # salva incrementalmente
         with out_csv.open("w", encoding="utf-8", newline="") as f:
@@ -187,6 +168,8 @@ def main():
         print(f"✅ Coletados {len(rows)} links em seções.")
         print(f"   - {out_csv}")
         print(f"   - {out_txt}")
+        if bloqueio:
+            print(bloqueio.resumo())
 
         ctx.close()
         browser.close()
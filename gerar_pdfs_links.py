@@ -1,54 +1,98 @@
 import asyncio
+import time
 from playwright.async_api import async_playwright
+from tdn_espera import aguardar_estavel_async
 import os
 
 ARQUIVO_LINKS = "links_organizados.txt"
 PASTA_SAIDA = "pdfs_links"
+CONCORRENCIA = 6          # páginas renderizando ao mesmo tempo (tamanho do pool)
+TIMEOUT_ITEM_S = 180      # teto por link (goto + espera + pdf)
 
-async def salvar_pdfs():
-    os.makedirs(PASTA_SAIDA, exist_ok=True)
+def ler_links(caminho):
+    """Gera (titulo, url) lendo o arquivo linha a linha (sem carregar tudo)."""
+    with open(caminho, "r", encoding="utf-8") as f:
+        for linha in f:
+            if ":" not in linha:
+                continue
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context()
+            # Divide em título e URL
+            partes = linha.split(":", 1)
+            if len(partes) != 2:
+                continue
 
-        with open(ARQUIVO_LINKS, "r", encoding="utf-8") as f:
-            linhas = f.readlines()
+            titulo, url = partes
+            titulo = titulo.strip().replace(" ", "_").replace("/", "_")
 
-        for linha in linhas:
-            try:
-                if ":" not in linha:
-                    continue
+            # Corrige URL (remove ":" inicial, espaços extras)
+            url = url.strip()
+            if url.startswith(":"):
+                url = url[1:].strip()
 
-                # Divide em título e URL
-                partes = linha.split(":", 1)
-                if len(partes) != 2:
-                    continue
+            if not url.startswith("http"):
+                print(f"⚠️ URL inválida ignorada: {url}")
+                continue
 
-                titulo, url = partes
-                titulo = titulo.strip().replace(" ", "_").replace("/", "_")
+            yield titulo, url
 
-                # Corrige URL (remove ":" inicial, espaços extras)
-                url = url.strip()
-                if url.startswith(":"):
-                    url = url[1:].strip()
+async def gerar_pdf(page, titulo, url):
+    print(f"📄 Gerando PDF de: {titulo} -> {url}")
+    await page.goto(url, wait_until="domcontentloaded", timeout=60000)
+    await aguardar_estavel_async(page)
 
-                if not url.startswith("http"):
-                    print(f"⚠️ URL inválida ignorada: {url}")
-                    continue
+    caminho_pdf = os.path.join(PASTA_SAIDA, f"{titulo}.pdf")
+    await page.pdf(path=caminho_pdf, format="A4")
 
-                print(f"📄 Gerando PDF de: {titulo} -> {url}")
-                page = await context.new_page()
-                await page.goto(url, wait_until="load", timeout=60000)
+async def salvar_pdfs():
+    os.makedirs(PASTA_SAIDA, exist_ok=True)
 
-                caminho_pdf = os.path.join(PASTA_SAIDA, f"{titulo}.pdf")
-                await page.pdf(path=caminho_pdf, format="A4")
-                await page.close()
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        context = await browser.new_context()
+
+        # pool de páginas reaproveitadas entre links; o semáforo limita quantos
+        # links estão em voo (e segura a leitura do arquivo quando o pool enche)
+        paginas = asyncio.Queue()
+        for _ in range(CONCORRENCIA):
+            paginas.put_nowait(await context.new_page())
+        sem = asyncio.Semaphore(CONCORRENCIA)
+        vistos = set()          # títulos repetidos gravariam o mesmo arquivo ao mesmo tempo
+        cont = {"ok": 0, "erro": 0}
+        inicio = time.time()
 
+        async def processar(titulo, url):
+            page = await paginas.get()
+            try:
+                await asyncio.wait_for(gerar_pdf(page, titulo, url), TIMEOUT_ITEM_S)
+                cont["ok"] += 1
             except Exception as e:
-                print(f"❌ Erro ao processar {linha.strip()}: {e}")
+                cont["erro"] += 1
+                motivo = f"timeout de {TIMEOUT_ITEM_S}s" if isinstance(e, asyncio.TimeoutError) else e
+                print(f"❌ Erro ao processar {titulo}: {url}: {motivo}")
+                # página pode ter ficado no meio de uma navegação/pdf: troca por outra
+                try:
+                    await page.close()
+                    page = await context.new_page()
+                except Exception:
+                    pass
+            finally:
+                paginas.put_nowait(page)
+                sem.release()
+
+        tarefas = []
+        for titulo, url in ler_links(ARQUIVO_LINKS):
+            if titulo in vistos:
+                continue
+            vistos.add(titulo)
+            await sem.acquire()
+            tarefas.append(asyncio.create_task(processar(titulo, url)))
+        await asyncio.gather(*tarefas)
 
+        while not paginas.empty():
+            await paginas.get_nowait().close()
         await browser.close()
 
+    print(f"✅ {cont['ok']} PDFs gerados, {cont['erro']} erros em {time.time() - inicio:.0f}s")
+
 if __name__ == "__main__":
     asyncio.run(salvar_pdfs())
@@ -1,17 +1,17 @@
 
 # -*- coding: utf-8 -*-
 from pathlib import Path
-import re, time, sys, json
-import requests
+import re, sys, json
 from urllib.parse import quote, urlsplit, parse_qs
+import tdn_api
+from tdn_lote import resolver_em_lote
+from tdn_disjuntor import DisjuntorEspacos
+from tdn_resolucoes import CacheResolucoes
 
-TDN_ROOT = "https://tdn.totvs.com.br"
-UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-      "(KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36")
-S = requests.Session()
-S.headers.update({"User-Agent": UA, "Accept": "application/json"})
+TDN_ROOT = tdn_api.TDN_ROOT
 
 SPACES_TRY = [None, "LDT"]  # tente outros se necessário, ex.: "LDS"
+USAR_CACHE = True           # cache de resoluções compartilhado (tdn_resolucoes)
 
 def limpar(s: str) -> str:
     if not s: return ""
@@ -26,44 +26,63 @@ def is_section(line: str) -> bool:
 def cql_escape(s: str) -> str:
     return s.replace('"','\\"')
 
-def api_get(url: str):
-    r = S.get(url, timeout=60)
-    if r.status_code in (401,403):
-        return None
-    if r.status_code >= 400:
-        return None
+def api_get_st(url: str):
+    """(status, json); status None em erro de rede, json None em erro HTTP."""
     try:
-        j = r.json()
+        st, j = tdn_api.get_json(url)
     except Exception:
-        return None
-    time.sleep(0.12)
-    return j
+        return None, None
+    return st, (j if st < 400 else None)
+
+def api_get(url: str):
+    return api_get_st(url)[1]
+
+# espaços proibidos/vazios saem na sondagem; os que falham seguido, por um tempo
+DISJUNTOR = DisjuntorEspacos()
 
 def busca_por_titulo(title: str):
+    """
+    (url, estratégia, completo); url vazia se não achou. completo=False se
+    alguma requisição falhou ou o disjuntor pulou um espaço: aí o "não
+    encontrado" não é confiável e não vai para o cache.
+    """
+    completo = True
     # 1) match exato por /content?title=...
-    for sk in SPACES_TRY:
+    for sk in DISJUNTOR.validos(SPACES_TRY):
+        if not DISJUNTOR.permitir(sk):
+            completo = False
+            continue
         url = f"{TDN_ROOT}/rest/api/content?title={quote(title)}"
         if sk: url += f"&spaceKey={quote(sk)}"
-        j = api_get(url)
+        st, j = api_get_st(url)
+        DISJUNTOR.resultado(sk, st)
+        if j is None:
+            completo = False
         if j and j.get("results"):
             for it in j["results"]:
                 if it.get("type") == "page":
-                    return f"{TDN_ROOT}/pages/releaseview.action?pageId={it['id']}"
+                    return f"{TDN_ROOT}/pages/releaseview.action?pageId={it['id']}", "exato", True
     # 2) busca CQL por título aproximado
     clauses = [f'type=page', f'(title ~ "{cql_escape(title)}")']
-    for sk in SPACES_TRY:
+    for sk in DISJUNTOR.validos(SPACES_TRY):
+        if not DISJUNTOR.permitir(sk):
+            completo = False
+            continue
         cql = " and ".join(clauses)
         if sk: cql = f"space = {sk} and " + cql
         url = f"{TDN_ROOT}/rest/api/search?cql={quote(cql)}&limit=10"
-        j = api_get(url)
+        st, j = api_get_st(url)
+        DISJUNTOR.resultado(sk, st)
+        if j is None:
+            completo = False
         if not j: continue
         for res in j.get("results", []):
             c = res.get("content", {})
             if c.get("type") != "page": continue
             cid = c.get("id")
             if cid:
-                return f"{TDN_ROOT}/pages/releaseview.action?pageId={cid}"
-    return ""
+                return f"{TDN_ROOT}/pages/releaseview.action?pageId={cid}", "aproximado", True
+    return "", "", completo
 
 def main():
     tit_path = Path("titulos.txt")
@@ -73,12 +92,37 @@ def main():
     lines = [ln.strip() for ln in tit_path.read_text(encoding="utf-8").splitlines() if ln.strip()]
     out = []
     current_section = ""
+    # o que já foi resolvido antes (por qualquer resolvedor) não vai à rede
+    cache = CacheResolucoes() if USAR_CACHE else None
+    do_cache = {}
+    if cache:
+        for ln in lines:
+            if not is_section(ln):
+                hit = cache.buscar(ln, "resolver_v1")
+                if hit is not None:
+                    do_cache[ln] = hit["url"]
+        print(f"Cache: {len(do_cache)} títulos já resolvidos")
+    # depois tudo em lote (poucas consultas CQL combinadas); a busca
+    # individual por título fica só para o que o lote não resolver
+    DISJUNTOR.sondar(SPACES_TRY, TDN_ROOT)
+    etapas = {}               # titulo -> etapa do lote (o cache só compartilha as confiáveis)
+    lote = resolver_em_lote([ln for ln in lines if not is_section(ln) and ln not in do_cache],
+                            DISJUNTOR.ativos(SPACES_TRY), api_get, TDN_ROOT, por_codigo=False,
+                            etapas=etapas)
     for ln in lines:
         if is_section(ln):
             current_section = ln
             out.append(current_section)
         else:
-            url = busca_por_titulo(ln)
+            if ln in do_cache:
+                url = do_cache[ln]
+            else:
+                if ln in lote:
+                    url, estrategia, completo = f"{TDN_ROOT}/pages/releaseview.action?pageId={lote[ln]}", f"lote/{etapas.get(ln, '')}", True
+                else:
+                    url, estrategia, completo = busca_por_titulo(ln)
+                if cache and (url or completo):
+                    cache.gravar(ln, "resolver_v1", url, estrategia)
             if url:
                 out.append(f" - {ln} :: {url}")
             else:
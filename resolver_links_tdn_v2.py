@@ -3,21 +3,37 @@
 """
 resolver_links_tdn_v2.py
 - Mostra progresso em tempo real (1 linha por item)
-- Timeout + retries nas chamadas
+- Timeout + retries nas chamadas (cliente compartilhado tdn_api: pool de
+  conexões, token bucket, backoff com jitter e Retry-After)
 - Log em arquivo: debug_resolver.log
-- Salva parcial mesmo se interromper (CTRL+C)
+- Salva parcial mesmo se interromper (CTRL+C); cada título resolvido vai
+  na hora (flush+fsync) para o diário .resolver_diario.jsonl, com o índice
+  da linha, e o trecho já contínuo de links_organizados.txt é escrito
+  conforme sai. Kill/queda perde no máximo o título em curso;
+  --resume pula as linhas que o diário já tem
+- Índice local dos espaços de SPACES_TRY (tdn_indice): título/código resolvem
+  sem rede; só o que falta no índice cai nas buscas pela API
+  (--reindexar refaz o índice; --sem-indice usa só a API)
+- O que o índice não resolve vai em lote (tdn_lote: poucas consultas CQL
+  combinadas); a busca individual por título fica só para o resto
+- Busca individual assíncrona: vários títulos ao mesmo tempo
+  (TITULOS_SIMULTANEOS) e, dentro de cada estratégia, os espaços disparados
+  juntos; vale o primeiro acerto na ordem de SPACES_TRY e o resto é
+  cancelado. Estratégias na mesma prioridade de antes; a saída é a mesma
+- Cache de resoluções compartilhado (tdn_resolucoes): título já resolvido
+  por qualquer resolvedor não vai à rede (--sem-cache ignora e regrava)
 """
 
 from pathlib import Path
-import re, time, sys, json, datetime, traceback
-import requests
+import asyncio, os, re, sys, json, datetime, traceback, argparse, threading
 from urllib.parse import quote, urlencode, urlsplit, parse_qs
+import tdn_api
+from tdn_indice import IndiceTitulos
+from tdn_lote import resolver_em_lote
+from tdn_disjuntor import DisjuntorEspacos
+from tdn_resolucoes import CacheResolucoes
 
-TDN_ROOT = "https://tdn.totvs.com.br"
-UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-      "(KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36")
-S = requests.Session()
-S.headers.update({"User-Agent": UA, "Accept": "application/json"})
+TDN_ROOT = tdn_api.TDN_ROOT
 
 # Tenta global (None) e em alguns espaços comuns; ajuste se souber a sigla certa
 SPACES_TRY = [None, "LDT", "LDS", "LFW", "LDP"]
@@ -25,19 +41,95 @@ SPACES_TRY = [None, "LDT", "LDS", "LFW", "LDP"]
 CONNECT_TIMEOUT = 10
 READ_TIMEOUT = 25
 RETRIES = 3
-SLEEP_BETWEEN = 0.15
+TITULOS_SIMULTANEOS = 8          # títulos resolvidos ao mesmo tempo
+REQ_SIMULTANEAS = tdn_api.CONCORRENCIA   # chamadas em voo (a taxa é do tdn_api)
 
 LOG = Path("debug_resolver.log")
+DIARIO = Path(".resolver_diario.jsonl")
+SAIDA = Path("links_organizados.txt")
+
+_LOG_F = None             # aberto uma vez; com buffer de linha
+_LOG_LOCK = threading.Lock()
 
 def log(msg: str):
+    global _LOG_F
     line = f"[{datetime.datetime.now().strftime('%H:%M:%S')}] {msg}"
     print(line, flush=True)
     try:
-        with LOG.open("a", encoding="utf-8") as f:
-            f.write(line + "\n")
+        with _LOG_LOCK:
+            if _LOG_F is None:
+                _LOG_F = LOG.open("a", encoding="utf-8", buffering=1)
+            _LOG_F.write(line + "\n")
     except Exception:
         pass
 
+class DiarioResolucao:
+    """
+    Journal append-only (JSONL) das resoluções: uma linha por título
+      {"idx": n, "titulo", "url", "origem"}   (url vazia = não encontrado)
+    com flush+fsync por linha. Sem retomar, começa vazio. Na retomada vale
+    só o que ainda bate com titulos.txt (mesmo título no mesmo idx).
+    Linhas truncadas (kill no meio da escrita) são ignoradas.
+    """
+    def __init__(self, caminho: Path, retomar: bool = False):
+        self.feitos = {}           # idx -> {"titulo", "url", "origem"}
+        if retomar and caminho.exists():
+            with caminho.open("r", encoding="utf-8") as f:
+                for ln in f:
+                    try:
+                        ev = json.loads(ln)
+                    except ValueError:
+                        continue
+                    self.feitos[ev.pop("idx")] = ev
+        self._f = caminho.open("a" if retomar else "w", encoding="utf-8")
+        if retomar and caminho.stat().st_size and not caminho.read_bytes().endswith(b"\n"):
+            self._f.write("\n")   # fecha a linha truncada para não colar na próxima
+
+    def retomados(self, lines) -> dict:
+        """{idx: url} das linhas já resolvidas em execução anterior."""
+        return {i: ev["url"] for i, ev in self.feitos.items()
+                if 1 <= i <= len(lines) and lines[i - 1] == ev.get("titulo")}
+
+    def gravar(self, idx: int, titulo: str, url: str, origem: str):
+        self._f.write(json.dumps({"idx": idx, "titulo": titulo, "url": url, "origem": origem},
+                                 ensure_ascii=False) + "\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def fechar(self):
+        self._f.close()
+
+def linha_saida(ln: str, url: str) -> str:
+    return f" - {ln} :: {url}" if url else f" - {ln} :: (NÃO ENCONTRADO)"
+
+class SaidaContinua:
+    """
+    Escreve em links_organizados.txt o trecho inicial já resolvido (seções +
+    títulos, na ordem de titulos.txt) conforme os resultados chegam fora de
+    ordem. O arquivo final é reescrito inteiro no fim, igual ao de antes.
+    """
+    def __init__(self, caminho: Path, lines, resultados: dict):
+        self.lines = lines
+        self.resultados = resultados
+        self.pos = 0
+        self._f = caminho.open("w", encoding="utf-8")
+
+    def avancar(self):
+        while self.pos < len(self.lines):
+            idx, ln = self.pos + 1, self.lines[self.pos]
+            if is_section(ln):
+                saida = ln
+            elif idx in self.resultados:
+                saida = linha_saida(ln, self.resultados[idx])
+            else:
+                break
+            self._f.write(("\n" if self.pos else "") + saida)
+            self.pos += 1
+        self._f.flush()
+
+    def fechar(self):
+        self._f.close()
+
 def limpar(s: str) -> str:
     if not s: return ""
     return re.sub(r"\s+", " ", s.strip())
@@ -50,74 +142,190 @@ def is_section(line: str) -> bool:
 def cql_escape(s: str) -> str:
     return s.replace('"','\\"')
 
+def api_get_st(url: str):
+    """(status, json); status None em erro de rede, json None em erro HTTP."""
+    try:
+        st, j = tdn_api.get_json(url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), retries=RETRIES)
+    except Exception as e:
+        log(f"Falha em api_get após {RETRIES} tentativas: {url} | {e}")
+        return None, None
+    if st >= 400:
+        log(f"HTTP {st} para {url}")
+        return st, None
+    if j is None:
+        log(f"Resposta sem JSON válido: {url}")
+    return st, j
+
 def api_get(url: str):
-    last_exc = None
-    for t in range(1, RETRIES+1):
-        try:
-            r = S.get(url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
-            if r.status_code in (401,403):
-                log(f"HTTP {r.status_code} para {url}")
-                return None
-            if r.status_code >= 400:
-                log(f"HTTP {r.status_code} para {url}")
-                last_exc = Exception(f"HTTP {r.status_code}")
-            else:
-                try:
-                    j = r.json()
-                except Exception as e:
-                    last_exc = e
-                else:
-                    time.sleep(SLEEP_BETWEEN)
-                    return j
-        except Exception as e:
-            last_exc = e
-        time.sleep(0.5 * t)
-    log(f"Falha em api_get após {RETRIES} tentativas: {url} | {last_exc}")
+    return api_get_st(url)[1]
+
+# espaços proibidos/vazios saem na sondagem; os que falham seguido, por um tempo
+DISJUNTOR = DisjuntorEspacos()
+
+_REQ = None               # asyncio.Semaphore das chamadas em voo (criado dentro do loop)
+
+async def api_get_async(url: str):
+    # tdn_api continua fazendo taxa/retries; aqui só se limita o que está em voo
+    async with _REQ:
+        return await asyncio.to_thread(api_get_st, url)
+
+def _url_pagina(pid) -> str:
+    return f"{TDN_ROOT}/pages/releaseview.action?pageId={pid}"
+
+def _de_content(j):
+    for it in j.get("results") or []:
+        if it.get("type") == "page":
+            return _url_pagina(it["id"])
+    return None
+
+def _de_busca(j):
+    for res in j.get("results", []):
+        c = res.get("content", {})
+        if c.get("type") != "page": continue
+        cid = c.get("id")
+        if cid:
+            return _url_pagina(cid)
     return None
 
-def busca_por_titulo(title: str):
+def estrategias(title: str):
+    """[(nome, extrair, montar_url(sk))] na ordem de prioridade."""
     title_q = quote(title)
+    out = []
     # 1) match exato por /content?title=...
-    for sk in SPACES_TRY:
+    def exato(sk):
         url = f"{TDN_ROOT}/rest/api/content?title={title_q}"
         if sk: url += f"&spaceKey={quote(sk)}"
-        j = api_get(url)
-        if j and j.get("results"):
-            for it in j["results"]:
-                if it.get("type") == "page":
-                    return f"{TDN_ROOT}/pages/releaseview.action?pageId={it['id']}"
+        return url
+    out.append(("exato", _de_content, exato))
     # 2) busca por código se existir na string (melhor precisão)
     m = re.search(r"\b(CP(?:R)?\d{3,4}|CPAPI\d+[A-Z]?|BOIN\d+|DMCP0*\d+|FF_[A-Za-z0-9_]+)\b", title, re.I)
     code = m.group(1) if m else None
     if code:
-        for sk in SPACES_TRY:
+        def por_codigo(sk):
             cql = f'type=page and (title ~ "{cql_escape(code)}" or text ~ "{cql_escape(code)}")'
             if sk: cql = f"space = {sk} and " + cql
-            url = f"{TDN_ROOT}/rest/api/search?cql={quote(cql)}&limit=10"
-            j = api_get(url)
-            if not j: continue
-            for res in j.get("results", []):
-                c = res.get("content", {})
-                if c.get("type") != "page": continue
-                cid = c.get("id")
-                if cid:
-                    return f"{TDN_ROOT}/pages/releaseview.action?pageId={cid}"
+            return f"{TDN_ROOT}/rest/api/search?cql={quote(cql)}&limit=10"
+        out.append(("código", _de_busca, por_codigo))
     # 3) busca CQL por título aproximado
-    for sk in SPACES_TRY:
+    def aproximado(sk):
         cql = f'type=page and (title ~ "{cql_escape(title)}")'
         if sk: cql = f"space = {sk} and " + cql
-        url = f"{TDN_ROOT}/rest/api/search?cql={quote(cql)}&limit=10"
-        j = api_get(url)
-        if not j: continue
-        for res in j.get("results", []):
-            c = res.get("content", {})
-            if c.get("type") != "page": continue
-            cid = c.get("id")
-            if cid:
-                return f"{TDN_ROOT}/pages/releaseview.action?pageId={cid}"
-    return ""
+        return f"{TDN_ROOT}/rest/api/search?cql={quote(cql)}&limit=10"
+    out.append(("aproximado", _de_busca, aproximado))
+    return out
+
+async def _tentar(sk, url: str, extrair):
+    """(url ou None, ok); ok=False se a requisição falhou ou o disjuntor pulou o espaço."""
+    # a vez no disjuntor é pega só quando a tarefa roda de fato
+    if not DISJUNTOR.permitir(sk):
+        return None, False
+    try:
+        st, j = await api_get_async(url)
+    except asyncio.CancelledError:
+        DISJUNTOR.desistir(sk)
+        raise
+    DISJUNTOR.resultado(sk, st, log)
+    return (extrair(j) if j else None), j is not None
+
+async def _corrida(tentativas):
+    """
+    Dispara as variantes de espaço juntas. Vence o primeiro acerto na ordem
+    de SPACES_TRY (mesmo resultado da busca sequencial); decidido o
+    vencedor, as demais são canceladas. Devolve (url ou None, completo).
+    """
+    tarefas = [asyncio.ensure_future(t) for t in tentativas]
+    completo = True
+    try:
+        for t in tarefas:
+            r, ok = await t
+            if r:
+                return r, True
+            completo = completo and ok
+        return None, completo
+    finally:
+        for t in tarefas:
+            t.cancel()
+
+async def busca_por_titulo(title: str):
+    """
+    (url, estratégia, completo); url vazia se não achou. completo=False se
+    alguma requisição falhou ou o disjuntor pulou um espaço: aí o "não
+    encontrado" não é confiável e não vai para o cache.
+    """
+    completo = True
+    # estratégias em sequência (prioridade), espaços de cada uma em paralelo
+    for nome, extrair, montar in estrategias(title):
+        r, ok = await _corrida([_tentar(sk, montar(sk), extrair) for sk in DISJUNTOR.validos(SPACES_TRY)])
+        if r:
+            return r, nome, True
+        completo = completo and ok
+    return "", "", completo
+
+INDICE = None             # IndiceTitulos, carregado em main()
+LOTE = {}                 # titulo -> pageId resolvido pela busca em lote
+ETAPAS_LOTE = {}          # titulo -> etapa do lote que resolveu (exato/código/aproximado)
+CACHE = None              # CacheResolucoes, aberto em main()
+USAR_CACHE = True         # False com --sem-cache: só grava
+
+def do_cache(title: str):
+    if not (CACHE and USAR_CACHE):
+        return None
+    return CACHE.buscar(title, "resolver_v2")
+
+async def resolver(title: str):
+    """(url, origem): índice local, cache, lote CQL; busca individual só no que sobrar."""
+    pid = INDICE.buscar(title) if INDICE else None
+    if pid:
+        return _url_pagina(pid), "índice"
+    hit = do_cache(title)
+    if hit is not None:
+        return hit["url"], "cache"
+    if title in LOTE:
+        url, origem, completo = _url_pagina(LOTE[title]), f"lote/{ETAPAS_LOTE.get(title, '')}", True
+    else:
+        url, origem, completo = await busca_por_titulo(title)
+        origem = f"API/{origem}" if origem else "API"
+    if CACHE and (url or completo):
+        CACHE.gravar(title, "resolver_v2", url, origem)
+    return url, origem
+
+async def resolver_todos(lines, resultados: dict, diario: DiarioResolucao = None,
+                         saida: SaidaContinua = None):
+    """
+    Resolve os títulos em paralelo; resultados[idx] = url ("" se não achou).
+    Índices já presentes em resultados (retomada) não são resolvidos de novo.
+    """
+    global _REQ
+    _REQ = asyncio.Semaphore(REQ_SIMULTANEAS)
+    vagas = asyncio.Semaphore(TITULOS_SIMULTANEOS)
+    total = len(lines)
+    async def um(idx, ln):
+        async with vagas:
+            log(f"[{idx}/{total}] Buscando: {ln}")
+            url, origem = await resolver(ln)
+            resultados[idx] = url
+            if diario:
+                diario.gravar(idx, ln, url, origem)
+            if saida:
+                saida.avancar()
+            if url:
+                log(f"[{idx}/{total}] OK ({origem}) -> {url}")
+            else:
+                log(f"[{idx}/{total}] NÃO ENCONTRADO")
+    if saida:
+        saida.avancar()
+    await asyncio.gather(*(um(idx, ln) for idx, ln in enumerate(lines, start=1)
+                           if not is_section(ln) and idx not in resultados))
 
 def main():
+    global INDICE, LOTE, CACHE, USAR_CACHE
+    ap = argparse.ArgumentParser(description="Resolve titulos.txt em links_organizados.txt.")
+    ap.add_argument("--reindexar", action="store_true", help="Enumera os espaços de novo, mesmo com índice válido.")
+    ap.add_argument("--sem-indice", action="store_true", help="Não usa o índice local (só buscas pela API).")
+    ap.add_argument("--sem-cache", action="store_true", help="Ignora o cache de resoluções (resolve de novo e regrava).")
+    ap.add_argument("--resume", action="store_true", help=f"Retoma pelo diário ({DIARIO}): pula as linhas já resolvidas.")
+    args = ap.parse_args()
+
     tit_path = Path("titulos.txt")
     if not tit_path.exists():
         print("titulos.txt não encontrado")
@@ -127,28 +335,49 @@ def main():
     current_section = ""
     total = len(lines)
     log(f"Iniciando. Linhas: {total}")
+    diario = DiarioResolucao(DIARIO, retomar=args.resume)
+    resultados = diario.retomados(lines)
+    if args.resume:
+        log(f"Retomando: {len(resultados)} linhas já resolvidas no diário")
+    DISJUNTOR.sondar(SPACES_TRY, TDN_ROOT, log=log)
+    espacos = DISJUNTOR.ativos(SPACES_TRY)
+    if not args.sem_indice:
+        INDICE = IndiceTitulos()
+        INDICE.carregar([sk for sk in espacos if sk], forcar=args.reindexar, log=log)
+    CACHE = CacheResolucoes()
+    USAR_CACHE = not args.sem_cache
+    faltam = [ln for idx, ln in enumerate(lines, start=1)
+              if not is_section(ln) and idx not in resultados
+              and not (INDICE and INDICE.buscar(ln)) and do_cache(ln) is None]
+    if faltam:
+        try:
+            LOTE = resolver_em_lote(faltam, espacos, api_get, TDN_ROOT, log=log, etapas=ETAPAS_LOTE)
+        except Exception as e:
+            log(f"Lote CQL falhou ({e}); seguindo com a busca individual")
+    saida = SaidaContinua(SAIDA, lines, resultados)
     try:
-        for idx, ln in enumerate(lines, start=1):
-            if is_section(ln):
-                current_section = ln
-                out_lines.append(current_section)
-                log(f"[{idx}/{total}] Seção: {ln}")
-            else:
-                log(f"[{idx}/{total}] Buscando: {ln}")
-                url = busca_por_titulo(ln)
-                if url:
-                    out_lines.append(f" - {ln} :: {url}")
-                    log(f"[{idx}/{total}] OK -> {url}")
-                else:
-                    out_lines.append(f" - {ln} :: (NÃO ENCONTRADO)")
-                    log(f"[{idx}/{total}] NÃO ENCONTRADO")
+        asyncio.run(resolver_todos(lines, resultados, diario, saida))
     except KeyboardInterrupt:
         log("Interrompido pelo usuário. Salvando parcial...")
     except Exception as e:
         log("Erro inesperado: " + repr(e))
         log(traceback.format_exc())
+    finally:
+        diario.fechar()
+        saida.fechar()
+
+    # saída na ordem de titulos.txt; no parcial, até o primeiro título sem resposta
+    for idx, ln in enumerate(lines, start=1):
+        if is_section(ln):
+            current_section = ln
+            out_lines.append(current_section)
+            log(f"[{idx}/{total}] Seção: {ln}")
+        elif idx not in resultados:
+            break
+        else:
+            out_lines.append(linha_saida(ln, resultados[idx]))
 
-    Path("links_organizados.txt").write_text("\n".join(out_lines), encoding="utf-8")
+    SAIDA.write_text("\n".join(out_lines), encoding="utf-8")
     log("✅ Gerado links_organizados.txt")
     print("\nConcluído. Veja links_organizados.txt e debug_resolver.log")
 
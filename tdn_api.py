@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Cliente HTTP compartilhado por todos os scripts que falam com o TDN.
+
+- Uma requests.Session com pool de conexões (reaproveita TCP/TLS entre chamadas)
+- Limitador token bucket (taxa média + rajada) no lugar dos time.sleep fixos
+- Retries com backoff exponencial + jitter; respeita Retry-After (429/503),
+  pausando todas as threads, não só a que levou o 429
+- Concorrência configurável: no máximo N requisições em voo ao mesmo tempo
+- Cache em disco (SQLite) das respostas JSON, chaveado pela URL normalizada:
+  dentro do TTL responde sem rede; depois revalida com If-None-Match /
+  If-Modified-Since (304 = reaproveita o corpo); despejo por tamanho (LRU)
+
+Uso:
+    import tdn_api
+    tdn_api.configurar(taxa=10, concorrencia=8)   # opcional
+    status, dados = tdn_api.get_json(url)         # com cache
+    status, dados = tdn_api.get_json(url, ttl=0)  # sempre revalida
+    r = tdn_api.get(url_html)                     # requests.Response
+"""
+import json, random, sqlite3, threading, time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import requests
+from requests.adapters import HTTPAdapter
+
+# ============= CONFIG =============
+TDN_ROOT = "https://tdn.totvs.com.br"
+UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+      "(KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36")
+TAXA         = 8.0         # requisições por segundo (média)
+RAJADA       = 8           # quantas podem sair de uma vez após ociosidade
+CONCORRENCIA = 4           # requisições simultâneas (e tamanho do pool de conexões)
+RETRIES      = 4
+BACKOFF_BASE = 0.5         # s; dobra a cada tentativa (+ jitter)
+BACKOFF_MAX  = 30.0
+TIMEOUT      = (10, 60)    # (conexão, leitura)
+STATUS_RETRY = {429, 500, 502, 503, 504}
+CACHE_ATIVO  = True
+CACHE_DB     = Path(".tdn_http_cache.sqlite")
+CACHE_TTL    = 6 * 3600    # s sem ir à rede; depois disso, revalidação condicional
+CACHE_MAX_MB = 200
+# =================================
+
+class LimitadorTaxa:
+    """Token bucket thread-safe: `taxa` fichas/s, acumulando até `rajada`."""
+    def __init__(self, taxa: float, rajada: int):
+        self.taxa = float(taxa)
+        self.rajada = max(1, int(rajada))
+        self._fichas = float(self.rajada)
+        self._t = time.monotonic()
+        self._pausa_ate = 0.0
+        self._lock = threading.Lock()
+
+    def adquirir(self):
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                if agora < self._pausa_ate:
+                    espera = self._pausa_ate - agora
+                else:
+                    self._fichas = min(self.rajada, self._fichas + (agora - self._t) * self.taxa)
+                    self._t = agora
+                    if self._fichas >= 1:
+                        self._fichas -= 1
+                        return
+                    espera = (1 - self._fichas) / self.taxa
+            time.sleep(espera)
+
+    def pausar(self, segundos: float):
+        """Segura todo mundo por `segundos` (Retry-After vale para o cliente inteiro)."""
+        with self._lock:
+            self._pausa_ate = max(self._pausa_ate, time.monotonic() + segundos)
+            self._fichas = 0.0
+
+def _nova_sessao(pool: int) -> requests.Session:
+    s = requests.Session()
+    s.headers.update({"User-Agent": UA})
+    ad = HTTPAdapter(pool_connections=pool, pool_maxsize=pool)
+    s.mount("https://", ad)
+    s.mount("http://", ad)
+    return s
+
+SESSION = _nova_sessao(CONCORRENCIA)
+LIMITADOR = LimitadorTaxa(TAXA, RAJADA)
+_SEMAFORO = threading.BoundedSemaphore(CONCORRENCIA)
+
+def configurar(taxa: float = None, rajada: int = None, concorrencia: int = None):
+    """Ajusta taxa/rajada/concorrência antes de começar as chamadas."""
+    global SESSION, LIMITADOR, _SEMAFORO
+    if taxa is not None or rajada is not None:
+        LIMITADOR = LimitadorTaxa(taxa or LIMITADOR.taxa, rajada or LIMITADOR.rajada)
+    if concorrencia is not None:
+        SESSION = _nova_sessao(concorrencia)
+        _SEMAFORO = threading.BoundedSemaphore(concorrencia)
+
+def _retry_after(r) -> float:
+    """Segundos pedidos pelo servidor em Retry-After (número ou data HTTP), ou None."""
+    val = (r.headers.get("Retry-After") or "").strip()
+    if not val:
+        return None
+    if val.isdigit():
+        return float(val)
+    try:
+        return max(0.0, parsedate_to_datetime(val).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _backoff(tentativa: int) -> float:
+    # exponencial com "full jitter"
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (tentativa - 1)))
+
+def get(url: str, headers: dict = None, timeout=TIMEOUT, retries: int = RETRIES, **kw) -> requests.Response:
+    """
+    GET limitado por taxa/concorrência, com retries.
+    Devolve a resposta (inclusive 4xx, e 429/5xx se esgotar as tentativas);
+    levanta a última exceção de rede se todas as tentativas falharem.
+    """
+    ultimo_exc = None
+    for tent in range(1, retries + 1):
+        LIMITADOR.adquirir()
+        try:
+            with _SEMAFORO:
+                r = SESSION.get(url, headers=headers, timeout=timeout, **kw)
+        except requests.RequestException as e:
+            ultimo_exc = e
+            if tent < retries:
+                time.sleep(_backoff(tent))
+            continue
+        if r.status_code not in STATUS_RETRY or tent == retries:
+            return r
+        ra = _retry_after(r)
+        if ra is not None:
+            LIMITADOR.pausar(min(ra, BACKOFF_MAX))
+        else:
+            time.sleep(_backoff(tent))
+    raise ultimo_exc
+
+def normalizar_url(url: str) -> str:
+    """Chave de cache: esquema/host em minúsculas, query ordenada, sem fragmento."""
+    u = urlsplit(url)
+    q = urlencode(sorted(parse_qsl(u.query, keep_blank_values=True)))
+    return urlunsplit((u.scheme.lower(), u.netloc.lower(), u.path, q, ""))
+
+class CacheHTTP:
+    """Respostas JSON em SQLite (WAL: várias threads/processos podem ler e gravar)."""
+    def __init__(self, caminho: Path, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._gravacoes = 0
+        self._con = sqlite3.connect(str(caminho), timeout=30, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("""CREATE TABLE IF NOT EXISTS respostas (
+            chave TEXT PRIMARY KEY, status INTEGER, corpo BLOB,
+            etag TEXT, last_modified TEXT, salvo REAL, acesso REAL, tamanho INTEGER)""")
+        self._con.commit()
+
+    def ler(self, chave: str):
+        with self._lock:
+            row = self._con.execute(
+                "SELECT status, corpo, etag, last_modified, salvo FROM respostas WHERE chave=?",
+                (chave,)).fetchone()
+            if not row:
+                return None
+            self._con.execute("UPDATE respostas SET acesso=? WHERE chave=?", (time.time(), chave))
+            self._con.commit()
+        return {"status": row[0], "corpo": row[1], "etag": row[2], "last_modified": row[3], "salvo": row[4]}
+
+    def gravar(self, chave: str, status: int, corpo: bytes, etag: str, last_modified: str):
+        agora = time.time()
+        with self._lock:
+            self._con.execute("INSERT OR REPLACE INTO respostas VALUES (?,?,?,?,?,?,?,?)",
+                              (chave, status, corpo, etag, last_modified, agora, agora, len(corpo)))
+            self._con.commit()
+            self._gravacoes += 1
+            if self._gravacoes % 50 == 0:
+                self._despejar()
+
+    def renovar(self, chave: str):
+        """304: o corpo guardado continua valendo; reinicia o TTL."""
+        with self._lock:
+            self._con.execute("UPDATE respostas SET salvo=?, acesso=? WHERE chave=?",
+                              (time.time(), time.time(), chave))
+            self._con.commit()
+
+    def _despejar(self):
+        total = self._con.execute("SELECT COALESCE(SUM(tamanho),0) FROM respostas").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # remove os menos acessados até ficar em ~90% do limite
+        excesso = total - int(self.max_bytes * 0.9)
+        for chave, tam in self._con.execute("SELECT chave, tamanho FROM respostas ORDER BY acesso").fetchall():
+            if excesso <= 0:
+                break
+            self._con.execute("DELETE FROM respostas WHERE chave=?", (chave,))
+            excesso -= tam
+        self._con.commit()
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+def _cache():
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = CacheHTTP(CACHE_DB, CACHE_MAX_MB * 1024 * 1024)
+        return _CACHE
+
+def configurar_cache(ativo: bool = None, caminho: Path = None, ttl: float = None, max_mb: int = None):
+    """Liga/desliga o cache, troca o arquivo, o TTL padrão ou o limite de tamanho."""
+    global CACHE_ATIVO, CACHE_DB, CACHE_TTL, CACHE_MAX_MB, _CACHE
+    with _CACHE_LOCK:
+        if ativo is not None: CACHE_ATIVO = ativo
+        if caminho is not None: CACHE_DB = Path(caminho)
+        if ttl is not None: CACHE_TTL = ttl
+        if max_mb is not None: CACHE_MAX_MB = max_mb
+        _CACHE = None
+
+def get_json(url: str, ttl: float = None, cache: bool = True, **kw):
+    """
+    GET de JSON: devolve (status_http, dados) — dados é None se não for JSON válido.
+    Respostas 200 passam pelo cache em disco; `ttl` (s) sobrepõe CACHE_TTL
+    (ttl=0 sempre revalida), cache=False ignora o cache.
+    """
+    headers = {"Accept": "application/json"}
+    headers.update(kw.pop("headers", None) or {})
+    usar_cache = cache and CACHE_ATIVO
+    guardado = None
+    if usar_cache:
+        chave = normalizar_url(url)
+        guardado = _cache().ler(chave)
+        validade = CACHE_TTL if ttl is None else ttl
+        if guardado and time.time() - guardado["salvo"] < validade:
+            return guardado["status"], json.loads(guardado["corpo"])
+        if guardado:
+            if guardado["etag"]: headers["If-None-Match"] = guardado["etag"]
+            if guardado["last_modified"]: headers["If-Modified-Since"] = guardado["last_modified"]
+
+    r = get(url, headers=headers, **kw)
+    if r.status_code == 304 and guardado:
+        _cache().renovar(chave)
+        return guardado["status"], json.loads(guardado["corpo"])
+    try:
+        dados = r.json() if r.status_code < 400 else None
+    except ValueError:
+        dados = None
+    if usar_cache and r.status_code == 200 and dados is not None:
+        _cache().gravar(chave, r.status_code, r.content,
+                        r.headers.get("ETag"), r.headers.get("Last-Modified"))
+    return r.status_code, dados
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Canonização de URLs do TDN pelo pageId.
+
+O mesmo conteúdo aparece como /display/[public/]SPACE/Titulo e como
+/pages/releaseview.action?pageId=N (ou viewpage.action). Para deduplicar,
+checar "já feito" e nomear saídas, todos os scripts devem usar a chave
+devolvida por chave_canonica(url): o pageId quando for possível descobrir,
+senão a URL normalizada.
+
+De onde vem o pageId, nesta ordem:
+  1) parâmetro pageId= da própria URL;
+  2) mapa persistente (SQLite) url -> pageId, alimentado por
+  3) registrar(url, page_id) — ex.: meta ajs-page-id lida durante o crawl —
+     ou pela API REST (content?spaceKey=&title=) quando rede=True.
+O mapa não expira: pageId é estável; título renomeado gera outra URL.
+"""
+import re, sqlite3, threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import urllib.parse as up
+import tdn_api
+
+# ============= CONFIG =============
+MAPA_DB = Path(".tdn_pageids.sqlite")
+TDN_ROOT = "https://tdn.totvs.com.br"
+# =================================
+
+_RE_PAGE_ID = re.compile(r"[?&]pageId=(\d+)")
+_UTM = {"utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content"}
+
+def normalizar(url: str) -> str:
+    """Sem fragmento/utm_*, esquema e host em minúsculas."""
+    u = up.urlsplit((url or "").strip())
+    qs = [(k, v) for k, v in up.parse_qsl(u.query, keep_blank_values=True) if k.lower() not in _UTM]
+    return up.urlunsplit((u.scheme.lower(), u.netloc.lower(), u.path, up.urlencode(qs), ""))
+
+def space_e_titulo(url: str):
+    """('LDT', 'Título') de uma URL /display/[public/]SPACE/Titulo; senão None."""
+    partes = [p for p in up.urlsplit(url).path.split("/") if p]
+    if len(partes) < 3 or partes[0] != "display":
+        return None
+    partes = partes[1:]
+    if partes[0] == "public" and len(partes) >= 3:
+        partes = partes[1:]
+    if len(partes) != 2:            # blog (/display/SPACE/2020/01/01/...) e afins
+        return None
+    return partes[0], up.unquote_plus(partes[1])
+
+class MapaPageIds:
+    """url normalizada -> pageId, em SQLite (várias threads/processos)."""
+    def __init__(self, caminho: Path):
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(str(caminho), timeout=30, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("CREATE TABLE IF NOT EXISTS mapa (url TEXT PRIMARY KEY, page_id TEXT)")
+        self._con.commit()
+
+    def get(self, url: str):
+        with self._lock:
+            row = self._con.execute("SELECT page_id FROM mapa WHERE url=?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, url: str, page_id: str):
+        with self._lock:
+            self._con.execute("INSERT OR REPLACE INTO mapa VALUES (?,?)", (url, page_id))
+            self._con.commit()
+
+_MAPA = None
+_MAPA_LOCK = threading.Lock()
+_SEM_ID = set()             # urls sem pageId nesta execução (não consulta de novo)
+
+def _mapa() -> MapaPageIds:
+    global _MAPA
+    with _MAPA_LOCK:
+        if _MAPA is None:
+            _MAPA = MapaPageIds(MAPA_DB)
+        return _MAPA
+
+def registrar(url: str, page_id):
+    """Ensina o mapa (ex.: meta ajs-page-id da página carregada a partir de `url`)."""
+    if page_id and str(page_id).isdigit() and not _RE_PAGE_ID.search(url or ""):
+        _mapa().put(normalizar(url), str(page_id))
+
+def _buscar_na_api(url: str):
+    st = space_e_titulo(url)
+    if not st:
+        return None
+    space, titulo = st
+    u = up.urlsplit(url)
+    root = f"{u.scheme}://{u.netloc}" if u.netloc else TDN_ROOT
+    q = up.urlencode({"spaceKey": space, "title": titulo, "type": "page"})
+    try:
+        status, j = tdn_api.get_json(f"{root}/rest/api/content?{q}")
+    except Exception:
+        return None
+    res = ((j or {}).get("results") or []) if status < 400 else []
+    return res[0]["id"] if res else None
+
+def page_id(url: str, rede: bool = True):
+    """pageId da URL (parâmetro, mapa persistente ou, com rede=True, REST); None se não achar."""
+    m = _RE_PAGE_ID.search(url or "")
+    if m:
+        return m.group(1)
+    chave = normalizar(url)
+    pid = _mapa().get(chave)
+    if pid or not rede or chave in _SEM_ID:
+        return pid
+    pid = _buscar_na_api(chave)
+    if pid:
+        _mapa().put(chave, pid)
+    else:
+        _SEM_ID.add(chave)
+    return pid
+
+def chave_canonica(url: str, rede: bool = True) -> str:
+    """pageId quando houver; senão a URL normalizada."""
+    return page_id(url, rede) or normalizar(url)
+
+def chaves_canonicas(urls, rede: bool = True) -> dict:
+    """{url: chave} para várias URLs, com as consultas REST em paralelo."""
+    urls = list(dict.fromkeys(urls))
+    with ThreadPoolExecutor(max_workers=tdn_api.CONCORRENCIA) as ex:
+        return dict(zip(urls, ex.map(lambda u: chave_canonica(u, rede), urls)))
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Sondagem de espaços e disjuntor (circuit breaker) para os resolvedores.
+
+- sondar(): uma chamada por spaceKey na partida; espaços proibidos
+  (401/403), inexistentes (404) ou sem páginas saem da lista para o resto
+  da execução, em vez de custarem uma ida à API por título.
+- permitir(sk) antes de cada requisição e resultado(sk, status) depois:
+  depois de FALHAS_MAX falhas seguidas o espaço "abre" o disjuntor e é
+  pulado por ESPERA_S; passado esse tempo, só UMA requisição passa
+  (meio-aberto) e as demais continuam pulando até ela voltar: se funcionar
+  fecha, se falhar abre de novo. Quem pegou a vez e desistiu (tarefa
+  cancelada) chama desistir(sk).
+- Conta como falha só o que é do espaço/servidor: erro de rede (status
+  None), 5xx, 429 e 401/403. Um 400 de uma CQL ruim é problema do título.
+None (busca global) nunca é desligado.
+"""
+import threading, time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+import tdn_api
+
+# ============= CONFIG =============
+FALHAS_MAX = 3             # falhas seguidas até abrir o disjuntor
+ESPERA_S   = 300           # s com o disjuntor aberto antes de tentar de novo
+# =================================
+
+class DisjuntorEspacos:
+    def __init__(self, falhas_max: int = FALHAS_MAX, espera_s: float = ESPERA_S):
+        self.falhas_max = falhas_max
+        self.espera_s = espera_s
+        self._lock = threading.Lock()
+        self.fora = {}             # space -> motivo (sondagem; vale a execução toda)
+        self._falhas = {}          # space -> falhas seguidas
+        self._aberto_ate = {}      # space -> time.monotonic() em que volta
+        self._testando = set()     # spaces com a tentativa do meio-aberto em voo
+
+    def sondar(self, spaces, root: str = tdn_api.TDN_ROOT, log=print):
+        """Testa cada spaceKey uma vez (em paralelo) e tira os inutilizáveis."""
+        def um(sk):
+            try:
+                st, j = tdn_api.get_json(
+                    f"{root}/rest/api/content?spaceKey={quote(sk)}&type=page&limit=1", retries=2)
+            except Exception as e:
+                return sk, None, f"erro de rede ({e})"
+            if st in (401, 403):
+                return sk, st, "sem acesso"
+            if st == 404:
+                return sk, st, "inexistente"
+            if st >= 400:
+                return sk, st, None        # erro passageiro: deixa o disjuntor decidir
+            if not (j or {}).get("results"):
+                return sk, st, "vazio"
+            return sk, st, None
+        alvos = [sk for sk in dict.fromkeys(spaces) if sk]
+        if not alvos:
+            return
+        with ThreadPoolExecutor(max_workers=min(len(alvos), tdn_api.CONCORRENCIA)) as ex:
+            for sk, st, motivo in ex.map(um, alvos):
+                if motivo and st is not None:
+                    self.fora[sk] = f"{motivo} (HTTP {st})"
+                    log(f"Espaço {sk}: {self.fora[sk]}; ignorado nesta execução")
+                elif motivo:
+                    self.falha(sk)
+                    log(f"Espaço {sk}: {motivo}")
+                else:
+                    log(f"Espaço {sk}: ok")
+
+    def disponivel(self, sk) -> bool:
+        """Fora da sondagem e com o disjuntor fechado (ou já no meio-aberto); não consome a vez."""
+        if sk is None:
+            return True
+        with self._lock:
+            if sk in self.fora:
+                return False
+            return time.monotonic() >= self._aberto_ate.get(sk, 0.0)
+
+    def ativos(self, spaces):
+        return [sk for sk in spaces if self.disponivel(sk)]
+
+    def validos(self, spaces):
+        """Os que passaram na sondagem (o disjuntor é checado por requisição, em permitir)."""
+        return [sk for sk in spaces if sk is None or sk not in self.fora]
+
+    def permitir(self, sk) -> bool:
+        """Chamar logo antes da requisição; False = pule este espaço agora."""
+        if sk is None:
+            return True
+        with self._lock:
+            if sk in self.fora:
+                return False
+            ate = self._aberto_ate.get(sk)
+            if ate is None:
+                return True
+            if time.monotonic() < ate or sk in self._testando:
+                return False
+            self._testando.add(sk)         # meio-aberto: esta é a única que passa
+            return True
+
+    def desistir(self, sk):
+        """Devolve a vez do meio-aberto sem resultado (requisição cancelada)."""
+        with self._lock:
+            self._testando.discard(sk)
+
+    def resultado(self, sk, status, log=None):
+        """status HTTP da requisição (None = erro de rede)."""
+        if status is None or status >= 500 or status in (401, 403, 429):
+            self.falha(sk, log)
+        else:
+            self.sucesso(sk)
+
+    def sucesso(self, sk):
+        if sk is None:
+            return
+        with self._lock:
+            self._falhas.pop(sk, None)
+            self._aberto_ate.pop(sk, None)
+            self._testando.discard(sk)
+
+    def falha(self, sk, log=None):
+        if sk is None:
+            return
+        with self._lock:
+            self._testando.discard(sk)
+            n = self._falhas.get(sk, 0) + 1
+            self._falhas[sk] = n
+            if n >= self.falhas_max:
+                self._aberto_ate[sk] = time.monotonic() + self.espera_s
+                self._falhas[sk] = self.falhas_max - 1     # meio-aberto: uma falha reabre
+                if log:
+                    log(f"Espaço {sk}: {n} falhas seguidas; pausado por {self.espera_s:.0f}s")
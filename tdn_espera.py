@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Detector de "página assentada" para Playwright, no lugar dos loops fixos de
+rolagem (SCROLL_STEPS x SCROLL_WAIT) e dos wait_for_timeout incondicionais.
+
+A página é considerada pronta quando, nesta ordem:
+  1) a rede fica ociosa (networkidle), limitado a metade do prazo — o TDN às
+     vezes mantém polling/analytics e nunca fica 100% ocioso;
+  2) o DOM fica sem mutações por `quieto_ms` (MutationObserver), rolando até o
+     fim sempre que a altura cresce, para disparar conteúdo lazy;
+  3) as imagens do documento terminam de decodificar (img.decode()).
+Tudo sob um prazo rígido `prazo_ms`: páginas curtas saem em ~quieto_ms,
+páginas longas esperam o que precisarem, até o prazo.
+
+Funciona com Page ou Frame (sync: aguardar_estavel; async: aguardar_estavel_async).
+"""
+import time
+
+# ============= CONFIG =============
+PRAZO_MS  = 20_000         # teto absoluto por página
+QUIETO_MS = 500            # janela sem mutações no DOM
+# =================================
+
+JS_ASSENTAR = """
+async ({quieto, prazo}) => {
+  const fim = Date.now() + prazo;
+  const dorme = ms => new Promise(r => setTimeout(r, ms));
+  let ultima = Date.now();
+  const obs = new MutationObserver(() => { ultima = Date.now(); });
+  obs.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+  try {
+    let altura = -1;
+    while (Date.now() < fim) {
+      const h = document.body ? document.body.scrollHeight : 0;
+      if (h !== altura) { altura = h; window.scrollTo(0, h); ultima = Date.now(); }
+      if (Date.now() - ultima >= quieto) break;
+      await dorme(50);
+    }
+    // imagens lazy fora da viewport: força carga e espera decodificar
+    const imgs = Array.from(document.images);
+    for (const i of imgs) { if (i.loading === 'lazy') i.loading = 'eager'; }
+    await Promise.race([
+      Promise.all(imgs.map(i => i.decode ? i.decode().catch(() => null) : null)),
+      dorme(Math.max(0, fim - Date.now())),
+    ]);
+    window.scrollTo(0, 0);
+  } finally {
+    obs.disconnect();
+  }
+  return true;
+}
+"""
+
+def _restante(inicio: float, prazo_ms: int) -> int:
+    return max(0, prazo_ms - int((time.monotonic() - inicio) * 1000))
+
+def aguardar_estavel(ctx, prazo_ms: int = PRAZO_MS, quieto_ms: int = QUIETO_MS):
+    """Espera a Page/Frame assentar (rede + DOM + imagens), no máximo prazo_ms."""
+    inicio = time.monotonic()
+    try:
+        ctx.wait_for_load_state("networkidle", timeout=prazo_ms // 2)
+    except Exception:
+        pass
+    try:
+        ctx.evaluate(JS_ASSENTAR, {"quieto": quieto_ms, "prazo": _restante(inicio, prazo_ms)})
+    except Exception:
+        pass
+
+async def aguardar_estavel_async(ctx, prazo_ms: int = PRAZO_MS, quieto_ms: int = QUIETO_MS):
+    """Versão para playwright.async_api."""
+    inicio = time.monotonic()
+    try:
+        await ctx.wait_for_load_state("networkidle", timeout=prazo_ms // 2)
+    except Exception:
+        pass
+    try:
+        await ctx.evaluate(JS_ASSENTAR, {"quieto": quieto_ms, "prazo": _restante(inicio, prazo_ms)})
+    except Exception:
+        pass
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Renderização multiprocesso com fila de trabalho em SQLite, à prova de crash.
+
+- renderizar_em_processos: o processo principal grava os itens numa fila
+  SQLite local e sobe K processos; cada processo tem seus próprios
+  navegadores (tdn_navegador.pool_navegadores) e "arrenda" itens da fila.
+  Um arrendamento vence após LEASE_S: se o processo morrer, o item volta
+  para a fila e outro processo o pega (até MAX_TENTATIVAS). Processos que
+  morrem são substituídos enquanto houver trabalho; se todos saírem (mesmo
+  com exit 0, ex.: navegador que não abre) com itens pendentes, sobem de
+  novo. Sem nenhum resultado por MAX_REINICIOS rodadas, o resto vira ERRO.
+- Os resultados ficam na própria fila; só o processo principal os lê e
+  chama ao_concluir, então log.csv/manifesto/status.json têm um único escritor.
+- reservar_global / reservado_global: reserva (e consulta) de nome de PDF
+  entre processos (tabela UNIQUE).
+- no_shard / ler_shard: divisão determinística de uma lista estática entre
+  invocações independentes (--shard i/n).
+"""
+import json, multiprocessing, os, sqlite3, threading, time, zlib
+from pathlib import Path
+
+# ============= CONFIG =============
+LEASE_S = 600              # segundos até um item arrendado voltar para a fila
+MAX_TENTATIVAS = 3         # arrendamentos por item antes de marcar ERRO
+MAX_REINICIOS = 2          # rodadas de processos novos sem nenhum resultado antes de desistir
+POLL_S = 0.5
+# =================================
+
+class FilaTrabalho:
+    """Fila em SQLite (WAL) compartilhada entre processos, com arrendamento."""
+    def __init__(self, caminho: Path):
+        self.caminho = Path(caminho)
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(str(self.caminho), timeout=60,
+                                    check_same_thread=False, isolation_level=None)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("""CREATE TABLE IF NOT EXISTS itens (
+            id INTEGER PRIMARY KEY, dados TEXT, estado TEXT DEFAULT 'pendente',
+            dono TEXT, lease_ate REAL, tentativas INTEGER DEFAULT 0,
+            resultado TEXT, lido INTEGER DEFAULT 0)""")
+        self._con.execute("CREATE TABLE IF NOT EXISTS nomes (caminho TEXT PRIMARY KEY)")
+
+    def popular(self, itens):
+        """Recomeça a fila com estes itens (dicts serializáveis em JSON)."""
+        with self._lock:
+            self._con.execute("BEGIN IMMEDIATE")
+            self._con.execute("DELETE FROM itens")
+            self._con.execute("DELETE FROM nomes")
+            self._con.executemany("INSERT INTO itens (dados) VALUES (?)",
+                                  [(json.dumps(it, ensure_ascii=False),) for it in itens])
+            self._con.execute("COMMIT")
+
+    def arrendar(self, dono: str, lease_s: float = LEASE_S):
+        """(id, dados) do próximo item livre (ou com arrendamento vencido); None se não há."""
+        agora = time.time()
+        with self._lock:
+            self._con.execute("BEGIN IMMEDIATE")
+            try:
+                # arrendamentos vencidos além do limite de tentativas viram ERRO
+                self._con.execute(
+                    "UPDATE itens SET estado='feito', resultado=? "
+                    "WHERE estado='arrendado' AND lease_ate < ? AND tentativas >= ?",
+                    (json.dumps([None, "ERRO", "worker caiu/expirou em todas as tentativas"]),
+                     agora, MAX_TENTATIVAS))
+                row = self._con.execute(
+                    "SELECT id, dados FROM itens WHERE estado='pendente' "
+                    "OR (estado='arrendado' AND lease_ate < ?) ORDER BY id LIMIT 1", (agora,)).fetchone()
+                if row:
+                    self._con.execute(
+                        "UPDATE itens SET estado='arrendado', dono=?, lease_ate=?, "
+                        "tentativas=tentativas+1 WHERE id=?", (dono, agora + lease_s, row[0]))
+                self._con.execute("COMMIT")
+            except Exception:
+                self._con.execute("ROLLBACK")
+                raise
+        return (row[0], json.loads(row[1])) if row else None
+
+    def concluir(self, item_id: int, dono: str, resultado):
+        with self._lock:
+            self._con.execute("UPDATE itens SET estado='feito', resultado=? WHERE id=? AND dono=?",
+                              (json.dumps(resultado, ensure_ascii=False), item_id, dono))
+
+    def liberar(self, dono: str):
+        """Devolve à fila, na hora, os itens arrendados por um processo que caiu."""
+        with self._lock:
+            self._con.execute("UPDATE itens SET lease_ate=0 WHERE estado='arrendado' AND dono=?", (dono,))
+
+    def abandonar(self, motivo: str):
+        """Marca como ERRO tudo o que ainda não foi feito."""
+        with self._lock:
+            self._con.execute("UPDATE itens SET estado='feito', resultado=? WHERE estado != 'feito'",
+                              (json.dumps([None, "ERRO", motivo], ensure_ascii=False),))
+
+    def restantes(self) -> int:
+        with self._lock:
+            return self._con.execute("SELECT COUNT(*) FROM itens WHERE estado != 'feito'").fetchone()[0]
+
+    def novos_resultados(self):
+        """[(dados, resultado)] concluídos e ainda não entregues ao processo principal."""
+        with self._lock:
+            rows = self._con.execute(
+                "SELECT id, dados, resultado FROM itens WHERE estado='feito' AND lido=0").fetchall()
+            if rows:
+                self._con.executemany("UPDATE itens SET lido=1 WHERE id=?", [(r[0],) for r in rows])
+        return [(json.loads(r[1]), json.loads(r[2])) for r in rows]
+
+    def reservar_nome(self, caminho) -> bool:
+        with self._lock:
+            cur = self._con.execute("INSERT OR IGNORE INTO nomes VALUES (?)", (str(caminho),))
+            return cur.rowcount == 1
+
+    def nome_reservado(self, caminho) -> bool:
+        with self._lock:
+            return self._con.execute("SELECT 1 FROM nomes WHERE caminho=?", (str(caminho),)).fetchone() is not None
+
+    def fechar(self):
+        self._con.close()
+
+_FILA_ATUAL = None         # definida dentro dos processos trabalhadores
+
+def reservar_global(caminho) -> bool:
+    """Reserva o nome entre processos; fora de um trabalhador sempre True."""
+    return _FILA_ATUAL.reservar_nome(caminho) if _FILA_ATUAL else True
+
+def reservado_global(caminho) -> bool:
+    """True se outro processo deste run já reservou o nome; fora de um trabalhador sempre False."""
+    return _FILA_ATUAL.nome_reservado(caminho) if _FILA_ATUAL else False
+
+def _serializavel(res):
+    # tarefas devolvem (Path|None, status, erro)
+    if res is None:
+        return None
+    return [str(x) if isinstance(x, Path) else x for x in res]
+
+def _processo_trabalhador(caminho_db, tarefa, workers, headless, perfil, lease_s):
+    global _FILA_ATUAL
+    from tdn_navegador import pool_navegadores
+    fila = FilaTrabalho(caminho_db)
+    _FILA_ATUAL = fila
+    dono = f"{os.getpid()}"
+
+    def proximo():
+        # sem item livre mas com trabalho arrendado por outros: espera — se
+        # alguém cair, o arrendamento vence e o item volta para cá
+        while True:
+            got = fila.arrendar(dono, lease_s)
+            if got:
+                return got
+            if fila.restantes() == 0:
+                return None
+            time.sleep(POLL_S)
+
+    def ao_concluir(got, res, erro):
+        item_id, _ = got
+        fila.concluir(item_id, dono, _serializavel(res) if res else [None, "ERRO", str(erro)])
+
+    def tarefa_fila(page, got):
+        return tarefa(page, got[1])
+
+    stats = pool_navegadores(proximo, tarefa_fila, ao_concluir, workers, headless, perfil)
+    if stats:
+        print(f"[pid {dono}] {stats.resumo()}", flush=True)
+    fila.fechar()
+
+def renderizar_em_processos(itens, tarefa, ao_concluir, processos, workers=1, headless=True,
+                            perfil=None, caminho_db=Path(".fila_render.sqlite"), lease_s=LEASE_S):
+    """
+    Como tdn_navegador.renderizar_em_paralelo, mas com `processos` processos
+    (cada um com `workers` navegadores). `tarefa` precisa ser uma função de
+    nível de módulo (vai por pickle) e devolver algo serializável em JSON
+    (Paths viram str e voltam como Path para ao_concluir).
+    """
+    itens = list(itens)
+    if not itens:
+        return
+    fila = FilaTrabalho(caminho_db)
+    fila.popular(itens)
+    mp = multiprocessing.get_context("spawn")
+    args = (str(caminho_db), tarefa, workers, headless, perfil, lease_s)
+
+    def subir():
+        p = mp.Process(target=_processo_trabalhador, args=args, daemon=True)
+        p.start()
+        return p
+
+    def entregar() -> int:
+        novos = fila.novos_resultados()
+        for dados, res in novos:
+            res = (Path(res[0]) if res[0] else None, *res[1:])
+            ao_concluir(dados, res, None)
+        return len(novos)
+
+    procs = [subir() for _ in range(min(processos, len(itens)))]
+    limite = MAX_REINICIOS * max(1, processos)
+    sem_progresso = 0          # processos subidos desde o último resultado
+
+    try:
+        while True:
+            if entregar():
+                sem_progresso = 0
+            if fila.restantes() == 0:
+                break
+            caidos = [i for i, p in enumerate(procs) if not p.is_alive() and p.exitcode not in (0, None)]
+            if not any(p.is_alive() for p in procs):
+                # todos saíram, mesmo com exit 0 (ex.: nenhum navegador abriu),
+                # e sobrou trabalho: sobe de novo até o limite, depois desiste
+                n = fila.restantes()
+                if n == 0:
+                    continue
+                for p in procs:
+                    fila.liberar(str(p.pid))
+                if sem_progresso >= limite:
+                    print(f"⚠️ nenhum processo ativo e {n} itens pendentes; marcando como ERRO", flush=True)
+                    fila.abandonar("nenhum processo trabalhador conseguiu processar o item")
+                    continue
+                print(f"⚠️ processos terminaram com {n} itens pendentes; subindo de novo", flush=True)
+                procs = [subir() for _ in range(min(processos, n))]
+                sem_progresso += len(procs)
+            elif caidos and sem_progresso < limite:
+                # substitui processos que caíram enquanto houver trabalho
+                for i in caidos:
+                    p = procs[i]
+                    print(f"⚠️ processo {p.pid} caiu (exit {p.exitcode}); subindo outro", flush=True)
+                    fila.liberar(str(p.pid))
+                    procs[i] = subir()
+                    sem_progresso += 1
+            time.sleep(POLL_S)
+    finally:
+        for p in procs:
+            p.join(5)
+            if p.is_alive():
+                p.terminate()
+        fila.fechar()
+
+def ler_shard(txt: str):
+    """'i/n' (1 <= i <= n) -> (i, n)."""
+    i, n = (int(x) for x in txt.split("/", 1))
+    if not 1 <= i <= n:
+        raise ValueError(f"shard inválido: {txt} (use i/n com 1 <= i <= n)")
+    return i, n
+
+def no_shard(chave: str, shard) -> bool:
+    """True se a chave cai neste shard (crc32 estável entre execuções/máquinas)."""
+    if not shard:
+        return True
+    i, n = shard
+    return zlib.crc32(chave.encode("utf-8")) % n == i - 1
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Índice local de títulos do TDN, por espaço.
+
+Uma enumeração paginada de /rest/api/content?spaceKey=X&type=page (só id e
+título) por espaço, guardada em .tdn_indice.json e reaproveitada por
+INDICE_TTL. Em memória viram dois mapas:
+  - título normalizado (sem acento/pontuação/caixa) -> pageId
+  - código de programa (CP0101, CPR123, BOIN001, MCF1234...) -> [pageIds]
+Assim a maioria dos títulos resolve com uma consulta a dicionário; só o que
+não está no índice vai para a rede.
+"""
+import difflib, json, re, threading, time, unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import quote
+import tdn_api
+
+# ============= CONFIG =============
+INDICE_ARQ = Path(".tdn_indice.json")
+INDICE_TTL = 24 * 3600     # s; depois disso o espaço é enumerado de novo
+LIMITE_PAGINA = 200
+# =================================
+
+RE_CODIGO = re.compile(
+    r"\b(CPR?\d{3,4}|CPAPI\d+[A-Z]?|BOIN\d+|DMCP0*\d+|FF_[A-Za-z0-9_]+|[A-Z]{2,4}\d{3,4})\b", re.I)
+
+def normalizar_titulo(s: str) -> str:
+    s = unicodedata.normalize("NFKD", s or "")
+    s = "".join(c for c in s if not unicodedata.combining(c)).casefold()
+    return " ".join(re.sub(r"[^\w]+", " ", s).split())
+
+def codigos(s: str):
+    return list(dict.fromkeys(m.upper() for m in RE_CODIGO.findall(s or "")))
+
+def enumerar_espaco(space: str, root: str = tdn_api.TDN_ROOT):
+    """[[id, título], ...] de todas as páginas do espaço (paginado)."""
+    paginas = []
+    url = f"{root}/rest/api/content?spaceKey={quote(space)}&type=page&limit={LIMITE_PAGINA}"
+    while url:
+        # sem cache HTTP: o próprio índice é o cache
+        st, j = tdn_api.get_json(url, cache=False)
+        if st >= 400 or not j:
+            raise RuntimeError(f"HTTP {st} ao enumerar {space}: {url}")
+        paginas += [[it["id"], it.get("title", "")] for it in j.get("results", [])]
+        nxt = (j.get("_links") or {}).get("next")
+        url = (nxt if nxt.startswith("http") else root + nxt) if nxt else None
+    return paginas
+
+class IndiceTitulos:
+    def __init__(self, caminho: Path = INDICE_ARQ, ttl: float = INDICE_TTL):
+        self.caminho = Path(caminho)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.espacos = {}          # space -> {"ts": float, "paginas": [[id, titulo]]}
+        if self.caminho.exists():
+            try:
+                self.espacos = json.loads(self.caminho.read_text(encoding="utf-8"))
+            except ValueError:
+                self.espacos = {}
+        self._montar()
+
+    def _montar(self):
+        # ordem dos espaços = ordem de prioridade (a do carregar)
+        self.por_titulo = {}       # título normalizado -> [(space, id, título)]
+        self.por_codigo = {}       # código -> [(space, id, título)]
+        for sk, d in self.espacos.items():
+            for pid, tit in d["paginas"]:
+                reg = (sk, pid, tit)
+                self.por_titulo.setdefault(normalizar_titulo(tit), []).append(reg)
+                for c in codigos(tit):
+                    self.por_codigo.setdefault(c, []).append(reg)
+
+    def carregar(self, spaces, forcar: bool = False, log=print):
+        """Garante os espaços no índice (enumera em paralelo os ausentes/vencidos)."""
+        agora = time.time()
+        faltam = [sk for sk in spaces if forcar or sk not in self.espacos
+                  or agora - self.espacos[sk]["ts"] > self.ttl]
+        def um(sk):
+            try:
+                pags = enumerar_espaco(sk)
+                log(f"Índice: {sk} com {len(pags)} páginas")
+                return sk, pags
+            except Exception as e:
+                log(f"Índice: falha ao enumerar {sk} ({e}); usando o que houver")
+                return sk, None
+        if faltam:
+            with ThreadPoolExecutor(max_workers=min(len(faltam), tdn_api.CONCORRENCIA)) as ex:
+                for sk, pags in ex.map(um, faltam):
+                    if pags is not None:
+                        self.espacos[sk] = {"ts": agora, "paginas": pags}
+            tmp = self.caminho.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.espacos, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+            tmp.replace(self.caminho)
+        # só os espaços pedidos, na ordem pedida
+        self.espacos = {sk: self.espacos[sk] for sk in spaces if sk in self.espacos}
+        self._montar()
+
+    def buscar(self, titulo: str):
+        """pageId pelo título exato (normalizado) ou pelo código de programa; None se não houver."""
+        regs = self.por_titulo.get(normalizar_titulo(titulo))
+        if regs:
+            return regs[0][1]
+        alvo = normalizar_titulo(titulo)
+        for c in codigos(titulo):
+            regs = self.por_codigo.get(c)
+            if regs:
+                # vários com o mesmo código: o título mais parecido
+                return max(regs, key=lambda r: difflib.SequenceMatcher(
+                    None, alvo, normalizar_titulo(r[2])).ratio())[1]
+        return None
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Resolução de títulos em lote via CQL (/rest/api/search).
+
+Em vez de uma busca por título, por espaço e por estratégia, junta muitos
+títulos numa mesma consulta, cortada no limite de tamanho da URL:
+  1) exato:    type=page and title in ("A", "B", ...)
+  2) código:   type=page and (title ~ "CP0101" or title ~ "BOIN001" ...)
+  3) aproximado: type=page and (title ~ "A" or title ~ "B" ...)
+pagina os resultados combinados e devolve cada acerto à(s) linha(s) de
+entrada localmente (título normalizado, código do programa, semelhança).
+O que não resolver aqui fica para a busca individual de cada resolvedor.
+"""
+import difflib
+from urllib.parse import quote
+import tdn_api
+from tdn_indice import normalizar_titulo, codigos
+
+# ============= CONFIG =============
+MAX_URL_CQL  = 6000        # tamanho máximo do parâmetro cql já codificado
+LIMITE       = 100         # resultados por página da busca
+MAX_PAGINAS  = 20          # páginas seguidas por consulta combinada
+SEMELHANCA_MIN = 0.75      # aceite do modo aproximado (além de "todas as palavras")
+MAX_APROX    = 25          # títulos por consulta aproximada (OR amplo demais dilui os resultados)
+# =================================
+
+def cql_escape(s: str) -> str:
+    return s.replace('"', '\\"')
+
+def _filtro_space(spaces) -> str:
+    # None na lista = busca global (como no resolvedor individual)
+    if not spaces or None in spaces:
+        return ""
+    return "space in (" + ",".join(spaces) + ") and "
+
+def _pedacos(itens, montar, max_itens=None):
+    """Agrupa itens em consultas cujo cql codificado cabe em MAX_URL_CQL."""
+    atual = []
+    for it in itens:
+        if atual and (len(quote(montar(atual + [it]))) > MAX_URL_CQL
+                      or (max_itens and len(atual) >= max_itens)):
+            yield montar(atual)
+            atual = []
+        atual.append(it)
+    if atual:
+        yield montar(atual)
+
+def _space_de(res) -> str:
+    disp = ((res.get("resultGlobalContainer") or {}).get("displayUrl") or "").rstrip("/")
+    return disp.rsplit("/", 1)[-1] if disp else ""
+
+def _buscar(root: str, cql: str, api_get):
+    """[(space, id, título)] das páginas da consulta, seguindo a paginação."""
+    out = []
+    url = f"{root}/rest/api/search?cql={quote(cql)}&limit={LIMITE}"
+    for _ in range(MAX_PAGINAS):
+        j = api_get(url)
+        if not j:
+            break
+        for res in j.get("results", []):
+            c = res.get("content") or {}
+            if c.get("type") == "page" and c.get("id"):
+                out.append((_space_de(res), c["id"], c.get("title") or ""))
+        nxt = (j.get("_links") or {}).get("next")
+        if not nxt:
+            break
+        url = nxt if nxt.startswith("http") else root + nxt
+    return out
+
+def _preferido(regs, spaces):
+    """Entre acertos equivalentes, o do espaço que vem antes em SPACES_TRY."""
+    ordem = {sk: i for i, sk in enumerate(s for s in spaces if s)}
+    return min(regs, key=lambda r: ordem.get(r[0], len(ordem)))
+
+def _semelhanca(a: str, b: str) -> float:
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+def _aceita(titulo_norm: str, hit_norm: str) -> float:
+    """Nota do acerto aproximado (0 = rejeitado)."""
+    palavras = [p for p in titulo_norm.split() if len(p) > 2]
+    r = _semelhanca(titulo_norm, hit_norm)
+    if palavras and set(palavras) <= set(hit_norm.split()):
+        return 1.0 + r
+    return r if r >= SEMELHANCA_MIN else 0.0
+
+def resolver_em_lote(titulos, spaces, api_get, root: str = tdn_api.TDN_ROOT,
+                     por_codigo: bool = True, log=print, etapas: dict = None) -> dict:
+    """
+    {titulo: pageId} para os títulos que a busca combinada resolveu.
+    `api_get(url)` é o do resolvedor (dict JSON ou None em erro).
+    Se `etapas` for dado, recebe {titulo: "exato" | "código" | "aproximado"}
+    (a etapa que resolveu), para quem precisa saber o quanto confiar.
+    """
+    if etapas is None:
+        etapas = {}
+    titulos = list(dict.fromkeys(t for t in titulos if t))
+    achados = {}
+    filtro = _filtro_space(spaces)
+    req = 0
+
+    # 1) exato
+    def montar_exato(ts):
+        return f"{filtro}type=page and title in (" + ",".join(f'"{cql_escape(t)}"' for t in ts) + ")"
+    hits = {}
+    for cql in _pedacos(titulos, montar_exato):
+        req += 1
+        for reg in _buscar(root, cql, api_get):
+            hits.setdefault(normalizar_titulo(reg[2]), []).append(reg)
+    for t in titulos:
+        regs = hits.get(normalizar_titulo(t))
+        if regs:
+            achados[t] = _preferido(regs, spaces)[1]
+            etapas[t] = "exato"
+
+    # 2) código do programa no título
+    if por_codigo:
+        pend = {t: codigos(t) for t in titulos if t not in achados}
+        todos = list(dict.fromkeys(c for cs in pend.values() for c in cs))
+        def montar_codigo(cs):
+            return f"{filtro}type=page and (" + " or ".join(f'title ~ "{cql_escape(c)}"' for c in cs) + ")"
+        por_cod = {}
+        for cql in _pedacos(todos, montar_codigo):
+            req += 1
+            for reg in _buscar(root, cql, api_get):
+                for c in codigos(reg[2]):
+                    por_cod.setdefault(c, []).append(reg)
+        for t, cs in pend.items():
+            regs = [r for c in cs for r in por_cod.get(c, [])]
+            if regs:
+                alvo = normalizar_titulo(t)
+                achados[t] = max(regs, key=lambda r: _semelhanca(alvo, normalizar_titulo(r[2])))[1]
+                etapas[t] = "código"
+
+    # 3) aproximado
+    pend = [t for t in titulos if t not in achados]
+    def montar_aprox(ts):
+        return f"{filtro}type=page and (" + " or ".join(f'title ~ "{cql_escape(t)}"' for t in ts) + ")"
+    regs = []
+    for cql in _pedacos(pend, montar_aprox, MAX_APROX):
+        req += 1
+        regs += _buscar(root, cql, api_get)
+    regs = [(r, normalizar_titulo(r[2])) for r in regs]
+    for t in pend:
+        alvo = normalizar_titulo(t)
+        melhor, nota = None, 0.0
+        for r, hn in regs:
+            n = _aceita(alvo, hn)
+            if n > nota:
+                melhor, nota = r, n
+        if melhor:
+            achados[t] = melhor[1]
+            etapas[t] = "aproximado"
+
+    log(f"Lote CQL: {len(achados)}/{len(titulos)} títulos resolvidos em {req} consultas combinadas")
+    return achados
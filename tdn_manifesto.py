@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Manifesto persistente dos downloads (manifesto.jsonl na pasta de saída).
+
+- Uma linha JSON por item processado, chaveada por pageId (ou pela URL quando
+  não há pageId); a última linha de cada chave vence.
+- É lido inteiro na partida: checar se um item já foi feito é uma consulta a
+  dicionário, feita antes de qualquer trabalho no navegador.
+- Append-only (com flush por linha), então um kill no meio perde no máximo a
+  linha corrente; linhas truncadas são ignoradas na leitura.
+"""
+import json, re, threading, time
+from pathlib import Path
+
+STATUS_FEITOS = {"OK", "SKIP"}
+
+def chave_de(url: str) -> str:
+    """pageId da URL quando houver; senão a própria URL."""
+    m = re.search(r"[?&]pageId=(\d+)", url or "")
+    return m.group(1) if m else (url or "")
+
+class Manifesto:
+    def __init__(self, caminho: Path, somente_leitura: bool = False, compactar: bool = True):
+        self.caminho = Path(caminho)
+        self.itens = {}
+        self._donos = {}     # pdf -> chave
+        self._lock = threading.Lock()
+        linhas = 0
+        if self.caminho.exists():
+            with self.caminho.open("r", encoding="utf-8") as f:
+                for ln in f:
+                    try:
+                        d = json.loads(ln)
+                    except ValueError:
+                        continue
+                    linhas += 1
+                    self._guardar(d)
+        # compacta quando o histórico já é bem maior que o estado atual
+        # (leitores, ex.: processos trabalhadores, nunca reescrevem nem anexam;
+        # com --shard, compactar=False: trocar o arquivo deixaria os outros
+        # shards em execução anexando num inode já desligado)
+        if compactar and not somente_leitura and linhas > 2 * len(self.itens) + 100:
+            self._reescrever()
+        self._f = None if somente_leitura else self.caminho.open("a", encoding="utf-8")
+
+    def _guardar(self, d):
+        self.itens[d["chave"]] = d
+        if d.get("pdf"):
+            self._donos[d["pdf"]] = d["chave"]
+
+    def _reescrever(self):
+        tmp = self.caminho.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for d in self.itens.values():
+                f.write(json.dumps(d, ensure_ascii=False) + "\n")
+        tmp.replace(self.caminho)
+
+    def get(self, chave: str):
+        return self.itens.get(chave)
+
+    def concluido(self, chave: str):
+        """Registro do item se já foi gerado e o PDF ainda está no disco; senão None."""
+        d = self.itens.get(chave)
+        if d and d.get("status") in STATUS_FEITOS and d.get("pdf") and Path(d["pdf"]).exists():
+            return d
+        return None
+
+    def dono(self, pdf) -> str:
+        """Chave que gerou este PDF (ou None se o manifesto não conhece o arquivo)."""
+        return self._donos.get(str(pdf))
+
+    def compartilhado(self, pdf, chave: str) -> bool:
+        """True se outra chave (não removida) também aponta para este PDF: não apague."""
+        pdf = str(pdf)
+        with self._lock:
+            return any(k != chave and d.get("pdf") == pdf and d.get("status") != "REMOVIDO"
+                       for k, d in self.itens.items())
+
+    def registrar(self, chave: str, url: str, pdf, status: str, **extra):
+        d = {"chave": chave, "url": url, "pdf": str(pdf) if pdf else "",
+             "status": status, "ts": int(time.time())}
+        d.update(extra)
+        with self._lock:
+            self._guardar(d)
+            self._f.write(json.dumps(d, ensure_ascii=False) + "\n")
+            self._f.flush()
+
+    def fechar(self):
+        if self._f:
+            self._f.close()
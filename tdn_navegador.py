@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Utilitários de navegador compartilhados pelos downloaders/coletores do TDN.
+
+- renderizar_em_paralelo: pool de N workers; cada worker é uma thread com o
+  seu próprio Playwright/Chromium, então as páginas renderizam de fato em
+  paralelo (um processo de navegador por worker).
+- buscar_export_view / imprimir_export_view: caminho leve de impressão — o
+  corpo export_view vem da API REST e é impresso num template local, sem o
+  JS/sidebars/analytics da releaseview. Páginas com macros que dependem de
+  JS voltam None e o chamador usa a página completa.
+- aplicar_perfil: interceptação de requisições no contexto com perfis
+  nomeados ("crawl", "print-lean") e contagem do que foi bloqueado.
+- expandir_e_coletar: expande tudo e filtra/deduplica os links dentro da
+  página, numa única chamada evaluate (sem um locator por botão/âncora).
+"""
+import html, re, threading, queue
+from playwright.sync_api import sync_playwright
+import tdn_api
+from tdn_espera import PRAZO_MS, QUIETO_MS
+
+# ============= CONFIG =============
+WORKERS  = 4               # navegadores simultâneos (padrão)
+HEADLESS = True
+VIEWPORT = {"width": 1400, "height": 900}
+TIMEOUT_PADRAO = 90_000
+# macros que só renderizam com JS no navegador (export_view vem vazio/placeholder)
+MACROS_COM_JS = ("pagetree", "pagetreesearch", "livesearch", "jira", "jiraissues",
+                 "drawio", "gliffy", "roadmap", "recently-updated", "contentbylabel",
+                 "blog-posts", "tasks-report-macro", "viewpdf", "widget")
+# hosts/caminhos de analytics e rastreamento (bloqueados em qualquer perfil)
+RASTREADORES = ("google-analytics.com", "googletagmanager.com", "doubleclick.net",
+                "hotjar.com", "connect.facebook.net", "facebook.com/tr", "newrelic.com",
+                "nr-data.net", "segment.io", "segment.com", "clarity.ms", "mixpanel.com",
+                "fullstory.com", "bat.bing.com", "/rest/analytics", "/plugins/servlet/analytics")
+# perfis de bloqueio: "permitir" = só esses tipos passam; "bloquear" = esses tipos caem
+PERFIS = {
+    "crawl":      {"permitir": {"document", "xhr", "fetch", "script"}},
+    "print-lean": {"bloquear": {"font", "media"}},   # media = vídeo/áudio (os maiores)
+}
+# =================================
+
+_RE_PRECISA_JS = re.compile(
+    r'<script\b|data-macro-name="(?:%s)"' % "|".join(re.escape(m) for m in MACROS_COM_JS), re.I)
+
+TEMPLATE_EXPORT = """<!DOCTYPE html>
+<html lang="pt-BR"><head><meta charset="utf-8">
+<base href="{root}/">
+<title>{titulo}</title>
+<link rel="stylesheet" href="{root}/styles/combined.css?spaceKey={space}">
+<style>
+  body {{ margin: 0 24px; font-family: Arial, Helvetica, sans-serif; font-size: 14px; }}
+  h1.titulo-pagina {{ font-size: 24px; margin: 16px 0; }}
+  img {{ max-width: 100%; height: auto; }}
+  table {{ border-collapse: collapse; }}
+  th, td {{ border: 1px solid #c1c7d0; padding: 4px 8px; vertical-align: top; }}
+  .expand-content {{ display: block !important; opacity: 1 !important; height: auto !important; }}
+</style>
+</head><body>
+<h1 class="titulo-pagina">{titulo}</h1>
+<div id="main-content" class="wiki-content">{corpo}</div>
+</body></html>"""
+
+def buscar_export_view(root: str, page_id: str):
+    """
+    (titulo, corpo_html, space_key) da página via REST, ou None quando não há
+    acesso/corpo ou quando alguma macro precisa de JS ao vivo.
+    """
+    # ttl=0: revalida no servidor, para não imprimir versão velha do cache
+    try:
+        st, j = tdn_api.get_json(f"{root}/rest/api/content/{page_id}?expand=body.export_view,space", ttl=0)
+    except Exception:
+        return None
+    if st >= 400 or not j:
+        return None
+    corpo = ((j.get("body") or {}).get("export_view") or {}).get("value") or ""
+    if not corpo.strip() or _RE_PRECISA_JS.search(corpo):
+        return None
+    return j.get("title", ""), corpo, (j.get("space") or {}).get("key", "")
+
+def imprimir_export_view(page, root: str, titulo: str, corpo: str, space_key: str, destino, print_bg=True):
+    doc = TEMPLATE_EXPORT.format(root=root, titulo=html.escape(titulo),
+                                 space=space_key, corpo=corpo)
+    page.set_content(doc, wait_until="networkidle", timeout=120_000)
+    page.pdf(path=str(destino), format="A4", print_background=print_bg)
+
+class EstatisticasBloqueio:
+    """Contadores por perfil (thread-safe: vários workers podem somar no mesmo)."""
+    def __init__(self, perfil: str):
+        self.perfil = perfil
+        self.bloqueadas = {}          # resource_type -> qtd
+        self.permitidas = 0
+        self.bytes_recebidos = 0
+        self._lock = threading.Lock()
+
+    def bloqueada(self, tipo: str):
+        with self._lock:
+            self.bloqueadas[tipo] = self.bloqueadas.get(tipo, 0) + 1
+
+    def recebida(self, resp):
+        try:
+            tam = int(resp.headers.get("content-length") or 0)
+        except (TypeError, ValueError):
+            tam = 0
+        with self._lock:
+            self.permitidas += 1
+            self.bytes_recebidos += tam
+
+    def resumo(self) -> str:
+        total = sum(self.bloqueadas.values())
+        tipos = ", ".join(f"{k}={v}" for k, v in sorted(self.bloqueadas.items(), key=lambda x: -x[1]))
+        return (f"Perfil '{self.perfil}': {total} requisições bloqueadas ({tipos or '-'}); "
+                f"{self.permitidas} permitidas, {self.bytes_recebidos/1_048_576:.1f} MB recebidos")
+
+def _deve_bloquear(cfg: dict, tipo: str, url: str) -> bool:
+    if any(r in url for r in RASTREADORES):
+        return True
+    if "permitir" in cfg:
+        return tipo not in cfg["permitir"]
+    return tipo in cfg.get("bloquear", ())
+
+def aplicar_perfil(ctx, perfil: str, stats: EstatisticasBloqueio = None) -> EstatisticasBloqueio:
+    """Instala o bloqueio do perfil no BrowserContext (sync) e devolve os contadores."""
+    cfg = PERFIS[perfil]
+    stats = stats or EstatisticasBloqueio(perfil)
+    def rota(route):
+        req = route.request
+        if _deve_bloquear(cfg, req.resource_type, req.url):
+            stats.bloqueada(req.resource_type)
+            route.abort()
+        else:
+            route.continue_()
+    ctx.route("**/*", rota)
+    ctx.on("response", stats.recebida)
+    return stats
+
+async def aplicar_perfil_async(ctx, perfil: str, stats: EstatisticasBloqueio = None) -> EstatisticasBloqueio:
+    """Mesmo que aplicar_perfil, para playwright.async_api."""
+    cfg = PERFIS[perfil]
+    stats = stats or EstatisticasBloqueio(perfil)
+    async def rota(route):
+        req = route.request
+        if _deve_bloquear(cfg, req.resource_type, req.url):
+            stats.bloqueada(req.resource_type)
+            await route.abort()
+        else:
+            await route.continue_()
+    await ctx.route("**/*", rota)
+    ctx.on("response", stats.recebida)
+    return stats
+
+def _abrir_pagina(ctx):
+    page = ctx.new_page()
+    page.set_default_timeout(TIMEOUT_PADRAO)
+    return page
+
+def pool_navegadores(proximo, tarefa, ao_concluir, workers=WORKERS, headless=HEADLESS, perfil=None):
+    """
+    Núcleo do pool: `workers` threads, cada uma com seu Playwright/Chromium,
+    puxando itens de proximo() até ele devolver None (proximo precisa ser
+    thread-safe). ao_concluir(item, resultado, erro) roda sob um lock único.
+    Devolve as EstatisticasBloqueio somadas (ou None sem `perfil`).
+    """
+    stats = EstatisticasBloqueio(perfil) if perfil else None
+    lock = threading.Lock()
+
+    def worker():
+        with sync_playwright() as pw:
+            browser = pw.chromium.launch(headless=headless)
+            ctx = browser.new_context(locale="pt-BR", viewport=VIEWPORT)
+            if perfil:
+                aplicar_perfil(ctx, perfil, stats)
+            page = _abrir_pagina(ctx)
+            try:
+                while True:
+                    it = proximo()
+                    if it is None:
+                        break
+                    # página pode ter morrido (crash do renderer) no item anterior
+                    if page.is_closed():
+                        page = _abrir_pagina(ctx)
+                    try:
+                        res, erro = tarefa(page, it), None
+                    except Exception as e:
+                        res, erro = None, e
+                    with lock:
+                        ao_concluir(it, res, erro)
+            finally:
+                try: ctx.close()
+                except: pass
+                browser.close()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, workers))]
+    for t in threads:
+        t.start()
+    # join com timeout para o CTRL+C continuar funcionando
+    while any(t.is_alive() for t in threads):
+        for t in threads:
+            t.join(0.5)
+    return stats
+
+def renderizar_em_paralelo(itens, tarefa, ao_concluir, workers=WORKERS, headless=HEADLESS, perfil=None):
+    """
+    Executa tarefa(page, item) para cada item usando `workers` navegadores.
+    Com `perfil` (ver PERFIS), cada contexto bloqueia recursos e a função
+    devolve as EstatisticasBloqueio somadas de todos os workers.
+
+    ao_concluir(item, resultado, erro) é chamado sob um lock único, na ordem em
+    que os itens terminam; quem grava log.csv/status.json nele não precisa se
+    preocupar com concorrência. `erro` é a exceção levantada pela tarefa (ou None).
+    """
+    itens = list(itens)
+    if not itens:
+        return EstatisticasBloqueio(perfil) if perfil else None
+    fila = queue.Queue()
+    for it in itens:
+        fila.put(it)
+
+    def proximo():
+        try:
+            return fila.get_nowait()
+        except queue.Empty:
+            return None
+
+    return pool_navegadores(proximo, tarefa, ao_concluir, min(workers, len(itens)), headless, perfil)
+
+JS_EXPANDIR_COLETAR = """
+async ({css, textos, ok, skip, dominio, quieto, prazo, passadas, coletar}) => {
+  const fim = Date.now() + prazo;
+  const dorme = ms => new Promise(r => setTimeout(r, ms));
+  for (const d of document.querySelectorAll('details')) d.open = true;
+  // cada controle é clicado uma vez só (senão os "expand all"/toggles fecham de novo)
+  const clicados = new WeakSet();
+  let ultima = Date.now(), cliques = 0;
+  const obs = new MutationObserver(() => { ultima = Date.now(); });
+  obs.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+  try {
+    for (let p = 0; p < passadas && Date.now() < fim; p++) {
+      const alvos = css.length ? Array.from(document.querySelectorAll(css.join(','))) : [];
+      for (const [tag, t] of textos)
+        for (const el of document.querySelectorAll(tag))
+          if ((el.textContent || '').toLowerCase().includes(t)) alvos.push(el);
+      let n = 0;
+      for (const el of alvos) {
+        if (clicados.has(el)) continue;
+        clicados.add(el);
+        try { el.click(); n++; } catch (e) {}
+      }
+      if (!n) break;                      // nada novo apareceu para expandir
+      cliques += n;
+      ultima = Date.now();
+      while (Date.now() < fim && Date.now() - ultima < quieto) await dorme(50);
+    }
+  } finally {
+    obs.disconnect();
+  }
+  if (!coletar) return {cliques, links: []};
+
+  const reOk = ok.map(([s, f]) => new RegExp(s, f));
+  const reSkip = skip.map(([s, f]) => new RegExp(s, f));
+  const utm = new Set(['utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content']);
+  const vistos = new Set(), links = [];
+  for (const a of document.querySelectorAll('a[href]')) {
+    let u;
+    try { u = new URL(a.href); } catch (e) { continue; }
+    if (!u.host.endsWith(dominio)) continue;
+    if (reSkip.some(r => r.test(u.pathname)) || !reOk.some(r => r.test(u.pathname))) continue;
+    u.hash = '';
+    for (const k of Array.from(u.searchParams.keys())) if (utm.has(k.toLowerCase())) u.searchParams.delete(k);
+    const chave = u.toString();
+    if (vistos.has(chave)) continue;
+    vistos.add(chave);
+    links.push([a.href, (a.textContent || '').trim()]);
+  }
+  return {cliques, links};
+}
+"""
+
+def _regex_js(padroes):
+    return [(p.pattern, "i" if p.flags & re.I else "") for p in padroes]
+
+def expandir_e_coletar(ctx, seletores, padroes_ok=(), padroes_skip=(), dominio="tdn.totvs.com.br",
+                       coletar=True, passadas=8, quieto_ms=QUIETO_MS, prazo_ms=PRAZO_MS):
+    """
+    Numa única chamada evaluate na Page/Frame: abre <details>, clica todos os
+    controles de `seletores` (CSS, ou 'tag:has-text("X")'), espera o DOM ficar
+    quieto e repete até nada novo aparecer; depois devolve [(href, texto)] das
+    âncoras do `dominio` cujo path passa nos filtros, sem repetição.
+    Os filtros são os mesmos regex do Python (o path não inclui a query).
+    """
+    css, textos = [], []
+    for sel in seletores:
+        m = re.fullmatch(r'(\w+):has-text\("(.+)"\)', sel)
+        if m:
+            textos.append((m.group(1), m.group(2).lower()))
+        else:
+            css.append(sel)
+    try:
+        res = ctx.evaluate(JS_EXPANDIR_COLETAR, {
+            "css": css, "textos": textos, "ok": _regex_js(padroes_ok), "skip": _regex_js(padroes_skip),
+            "dominio": dominio, "quieto": quieto_ms, "prazo": prazo_ms,
+            "passadas": passadas, "coletar": coletar})
+    except Exception:
+        return []
+    return [tuple(x) for x in res.get("links") or []]
@@ -1,24 +1,23 @@
 # -*- coding: utf-8 -*-
 from pathlib import Path
-from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
-import requests, re, csv, time, sys, json
+import requests, re, csv, time, json, argparse, threading
+import tdn_api, tdn_fila
 from urllib.parse import urlsplit, parse_qs, urlunsplit, urlencode
+from tdn_navegador import renderizar_em_paralelo, buscar_export_view, imprimir_export_view
+from tdn_manifesto import Manifesto
+from tdn_espera import aguardar_estavel
 
 # ============= CONFIG =============
 SEED_URL   = "https://tdn.totvs.com.br/pages/releaseview.action?pageId=224116750"
 OUT_BASE   = Path("PDFs_TDN")
 HEADLESS   = True
 PRINT_BG   = True          # imprimir com fundos (igual ao site)
-RATE_SLEEP = 0.15          # pausa leve entre chamadas à API
-SCROLL_STEPS = 80          # para páginas muito longas, aumente
-SCROLL_WAIT  = 200
+WORKERS    = 4             # navegadores em paralelo (--workers)
+PROCESSOS  = 1             # >1: processos com fila SQLite à prova de crash (--processos)
+MODO_RENDER = "export"     # "export" (corpo via REST, leve) ou "completo" (releaseview)
+PERFIL_REDE = None         # "print-lean" bloqueia rastreadores/fonts/mídia (--perfil)
 # =================================
 
-UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-      "(KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36")
-SESSION = requests.Session()
-SESSION.headers.update({"User-Agent": UA, "Accept": "application/json"})
-
 def limpar(txt: str) -> str:
     if not txt: return ""
     txt = re.sub(r"\s+", " ", txt.strip()).replace("\u00A0"," ")
@@ -46,13 +45,14 @@ def norm_url(u: str) -> str:
         for v in vals: qs_flat.append((k,v))
     return urlunsplit((p.scheme,p.netloc,p.path, urlencode(qs_flat), ""))
 
-def api_get(url: str):
-    r = SESSION.get(url, timeout=60)
-    if r.status_code in (401,403):
-        raise PermissionError(f"Sem acesso à API pública do TDN nesta área. HTTP {r.status_code} - {url}")
-    r.raise_for_status()
-    time.sleep(RATE_SLEEP)
-    return r.json()
+def api_get(url: str, ttl: float = None):
+    # taxa, pool de conexões, retries e cache em disco ficam no cliente compartilhado (tdn_api)
+    st, j = tdn_api.get_json(url, ttl=ttl)
+    if st in (401,403):
+        raise PermissionError(f"Sem acesso à API pública do TDN nesta área. HTTP {st} - {url}")
+    if st >= 400 or j is None:
+        raise requests.HTTPError(f"HTTP {st} - {url}")
+    return j
 
 def get_root_info(root_id: str, root: str):
     url = f"{root}/rest/api/content/{root_id}?expand=ancestors,space"
@@ -62,14 +62,19 @@ def get_root_info(root_id: str, root: str):
     ancestors = [{"id": a["id"], "title": a.get("title","")} for a in anc]
     return title, ancestors
 
-def list_descendants(root_id: str, root: str):
-    # paginação
+def list_descendants(root_id: str, root: str, ttl: float = None):
+    # paginação; expand=ancestors traz a cadeia de pais junto de cada página,
+    # evitando uma chamada extra por descendente; version serve ao modo incremental
     results = []
-    url = f"{root}/rest/api/content/{root_id}/descendant/page?limit=200&expand="
+    url = f"{root}/rest/api/content/{root_id}/descendant/page?limit=200&expand=ancestors,version"
     while url:
-        j = api_get(url)
+        j = api_get(url, ttl=ttl)
         for it in j.get("results", []):
-            results.append({"id": it["id"], "title": it.get("title","")})
+            anc = it.get("ancestors",[]) or []
+            ver = it.get("version") or {}
+            results.append({"id": it["id"], "title": it.get("title",""),
+                            "ancestors": [{"id": a["id"], "title": a.get("title","")} for a in anc],
+                            "version": ver.get("number"), "when": ver.get("when","")})
         # link next
         next_rel = j.get("_links", {}).get("next")
         if next_rel:
@@ -81,67 +86,167 @@ def list_descendants(root_id: str, root: str):
             url = None
     return results
 
-def get_ancestors_for(page_id: str, root: str):
-    url = f"{root}/rest/api/content/{page_id}?expand=ancestors"
-    j = api_get(url)
-    anc = j.get("ancestors",[]) or []
-    return [{"id": a["id"], "title": a.get("title","")} for a in anc]
-
-def build_path_for(page_id: str, root_id: str, root: str):
-    # monta caminho relativo ao root_id
-    anc = get_ancestors_for(page_id, root)
-    # corta tudo antes do root_id
-    path = []
-    found = False
-    for a in anc:
-        if a["id"] == root_id:
-            found = True
-            break
-    if found:
-        # pega somente os que vêm DEPOIS do root_id
-        take = False
-        for a in anc:
-            if take:
-                path.append(limpar(a["title"]))
-            if a["id"] == root_id:
-                take = True
-    else:
+def montar_caminhos(root_id: str, desc):
+    """
+    Monta, em memória, o caminho (títulos acima do nó, relativo ao root_id)
+    de cada descendente a partir de um mapa pageId -> pai.
+    Retorna {pageId: [títulos...]}.
+    """
+    pai, titulo = {}, {}
+    for d in desc:
+        cadeia = d["ancestors"] + [{"id": d["id"], "title": d["title"]}]
+        for i, a in enumerate(cadeia):
+            titulo.setdefault(a["id"], a["title"])
+            pai.setdefault(a["id"], cadeia[i-1]["id"] if i else None)
+
+    caminhos = {root_id: []}
+    def caminho(pid):
+        # sobe até achar um nó já resolvido (ou o topo do espaço)
+        subida = []
+        atual = pai.get(pid)
+        while atual is not None and atual not in caminhos:
+            subida.append(atual)
+            atual = pai.get(atual)
         # se o root não estiver nos ancestrais (raro), usa todos
-        path = [limpar(a["title"]) for a in anc]
-    return path
+        base = caminhos[atual] if atual is not None else []
+        for a in reversed(subida):
+            base = base + [limpar(titulo[a])]
+            caminhos[a] = base
+        return base
 
-def rolar_ate_fim(page):
-    last = 0
-    for _ in range(SCROLL_STEPS):
-        try:
-            page.evaluate("window.scrollBy(0, document.body.scrollHeight)")
-            page.wait_for_timeout(SCROLL_WAIT)
-            h = page.evaluate("document.body.scrollHeight")
-            if h == last: break
-            last = h
-        except: break
-
-def titulo_real(page) -> str:
+    return {d["id"]: caminho(d["id"]) for d in desc}
+
+def titulo_real(page, padrao: str = "pagina") -> str:
     try:
         t = page.title()
         t = re.sub(r"^(TOTVS\s*[\|\-]\s*)", "", t, flags=re.I)
-        return limpar(t) or "pagina"
-    except: return "pagina"
+        return limpar(t) or padrao
+    except: return padrao
 
-def salvar_pdf(page, url, destino: Path):
+def carregar_pagina(page, url):
     page.goto(url, wait_until="domcontentloaded", timeout=120_000)
-    page.wait_for_timeout(600)
-    rolar_ate_fim(page)
+    aguardar_estavel(page)      # rede + DOM quieto + imagens, com prazo
+
+def salvar_pdf(page, destino: Path):
+    # imprime a página já carregada por carregar_pagina (sem navegar de novo)
     page.pdf(path=str(destino), format="A4", print_background=PRINT_BG)
 
+_LOCK_NOMES = threading.Lock()
+_RESERVADOS = set()
+_MANIFESTO = None        # o de main(); nos processos trabalhadores, só leitura
+
+def _manifesto() -> Manifesto:
+    global _MANIFESTO
+    if _MANIFESTO is None:
+        _MANIFESTO = Manifesto(OUT_BASE / "manifesto.jsonl", somente_leitura=True)
+    return _MANIFESTO
+
+def adotar_existente(destino: Path, chave: str) -> bool:
+    """
+    True (e reserva o nome) se o PDF já está no disco, sem dono no manifesto
+    ou desta mesma chave, e ninguém deste run o reservou: SKIP legítimo.
+    PDF de outra página nunca é adotado (o SKIP iria para o manifesto como
+    se fosse desta, e o --incremental apagaria o arquivo alheio).
+    """
+    with _LOCK_NOMES:
+        if (destino.exists() and destino not in _RESERVADOS
+                and not tdn_fila.reservado_global(destino)
+                and _manifesto().dono(destino) in (None, chave)
+                and not _manifesto().compartilhado(destino, chave)
+                and tdn_fila.reservar_global(destino)):
+            _RESERVADOS.add(destino)
+            return True
+        return False
+
+def reservar(destino: Path) -> Path:
+    """Reserva um nome livre entre os workers (e processos): o próprio ou 'Nome (2).pdf'..."""
+    with _LOCK_NOMES:
+        cand = destino
+        i = 2
+        while cand in _RESERVADOS or cand.exists() or not tdn_fila.reservar_global(cand):
+            cand = Path(f"{destino.with_suffix('')} ({i}){destino.suffix}")
+            i += 1
+        _RESERVADOS.add(cand)
+        return cand
+
+def pasta_de(r) -> Path:
+    segs = [s for s in r["path"][:-1]] or ["Outros"]
+    return OUT_BASE.joinpath(*segs)
+
+def mudou(r, feito) -> bool:
+    """True se a página mudou desde o PDF registrado (nova versão ou movida de pasta)."""
+    if "versao" in feito and feito["versao"] != r["version"]:
+        return True
+    return Path(feito["pdf"]).parent != pasta_de(r)
+
+def nome_pdf(tit: str) -> str:
+    return re.sub(r'[\\/*?:"<>|]+', " ", f"{tit}.pdf").strip() or "pagina.pdf"
+
+def baixar_item(page, r):
+    """Tarefa de um worker: devolve (destino, status, erro)."""
+    pasta = pasta_de(r); pasta.mkdir(parents=True, exist_ok=True)
+    destino = None; err = ""
+
+    # caminho leve: export_view via REST num template local; se a página
+    # tiver macros que dependem de JS, segue para a página completa
+    if r.get("modo", MODO_RENDER) == "export":
+        root = base_url(r["url"])
+        exp = buscar_export_view(root, r["id"])
+        if exp:
+            titulo, corpo, space_key = exp
+            destino = pasta / nome_pdf(limpar(titulo) or r["title"] or "pagina")
+            if adotar_existente(destino, r["id"]):
+                return destino, "SKIP", ""
+            destino = reservar(destino)
+            try:
+                imprimir_export_view(page, root, titulo, corpo, space_key, destino, PRINT_BG)
+                return destino, "OK", ""
+            except Exception as e:
+                err = str(e)
+
+    # uma única carga por item: o título sai da página já carregada
+    # (às vezes difere do title da API por prefixos) e o PDF da mesma carga
+    for tent in range(3):
+        try:
+            carregar_pagina(page, r["url"])
+            if destino is None:
+                tit = titulo_real(page, padrao=r["title"] or "pagina")
+                destino = pasta / nome_pdf(tit)
+                if adotar_existente(destino, r["id"]):
+                    return destino, "SKIP", ""
+                destino = reservar(destino)
+            salvar_pdf(page, destino)
+            return destino, "OK", ""
+        except Exception as e:
+            err = str(e); time.sleep(0.8*(tent+1))
+    return destino, "ERRO", err
+
 def main():
-    seed = SEED_URL if len(sys.argv)==1 else sys.argv[1]
+    ap = argparse.ArgumentParser(description="Baixa em PDF a subárvore TDN a partir de uma página.")
+    ap.add_argument("seed", nargs="?", default=SEED_URL, help="URL com pageId da página raiz.")
+    ap.add_argument("--workers", type=int, default=WORKERS, help="Navegadores em paralelo.")
+    ap.add_argument("--modo", choices=["export", "completo"], default=MODO_RENDER,
+                    help="export: corpo via REST num template leve (volta ao completo se precisar de JS).")
+    ap.add_argument("--perfil", choices=["print-lean"], default=PERFIL_REDE,
+                    help="Bloqueia rastreadores, web fonts e vídeo/áudio ao renderizar.")
+    ap.add_argument("--processos", type=int, default=PROCESSOS,
+                    help="Processos de renderização (cada um com --workers navegadores).")
+    ap.add_argument("--shard", type=tdn_fila.ler_shard, default=None, metavar="i/n",
+                    help="Processa só a fatia i de n (para dividir entre máquinas/invocações).")
+    ap.add_argument("--incremental", action="store_true",
+                    help="Re-renderiza só páginas novas/alteradas (version do TDN) e remove as excluídas.")
+    args = ap.parse_args()
+    global _MANIFESTO
+
+    seed = args.seed
     root  = base_url(seed)
     root_id = get_page_id(seed)
 
     OUT_BASE.mkdir(parents=True, exist_ok=True)
     log_path    = OUT_BASE / "log.csv"
-    status_path = OUT_BASE / "status.json"
+    sufixo      = f".shard-{args.shard[0]}-{args.shard[1]}" if args.shard else ""
+    status_path = OUT_BASE / f"status{sufixo}.json"
+    principal   = not args.shard or args.shard[0] == 1   # só ele grava mapa/remoções
     links_csv   = OUT_BASE / "links_tree.csv"
     novo_log = not log_path.exists()
     flog = log_path.open("a", encoding="utf-8", newline="")
@@ -154,78 +259,108 @@ def main():
     print(f"Raiz: {root_title} (id={root_id})")
 
     # 2) lista todos os descendentes (recursivo) via REST
-    desc = list_descendants(root_id, root)
+    # no incremental a listagem sempre revalida no servidor (ttl=0)
+    desc = list_descendants(root_id, root, ttl=0 if args.incremental else None)
     print(f"Descendentes encontrados via REST: {len(desc)}")
 
-    # 3) constrói path completo relativo ao root e monta tabela
+    # 3) constrói path completo relativo ao root (em memória) e monta tabela
+    caminhos = montar_caminhos(root_id, desc)
     rows = []
-    for i, d in enumerate(desc, start=1):
+    for d in desc:
         pid = d["id"]
-        path = build_path_for(pid, root_id, root)  # tudo acima do nó (até root)
+        path = caminhos[pid]  # tudo acima do nó (até root)
         title = limpar(d["title"])
         url = f"{root}/pages/releaseview.action?pageId={pid}"
         full_path = path + [title]  # path completo
-        rows.append({"path": full_path, "title": title, "url": norm_url(url)})
-        if i % 50 == 0:
-            print(f"… {i}/{len(desc)} estruturados")
-
-    # 4) salva links_tree.csv
-    with links_csv.open("w", encoding="utf-8", newline="") as f:
-        w = csv.writer(f); w.writerow(["path","title","url"])
-        for r in rows:
-            w.writerow([" / ".join(r["path"]), r["title"], r["url"]])
-    print(f"Mapa salvo em: {links_csv}")
-
-    # 5) baixa PDFs mantendo a mesma árvore de pastas
-    with sync_playwright() as pw:
-        browser = pw.chromium.launch(headless=HEADLESS)
-        ctx = browser.new_context(locale="pt-BR", viewport={"width":1400,"height":900})
-        page = ctx.new_page(); page.set_default_timeout(90_000)
-
-        total = len(rows); start = time.time()
-        for i, r in enumerate(rows, start=1):
-            segs = [s for s in r["path"][:-1]] or ["Outros"]
-            pasta = OUT_BASE.joinpath(*segs); pasta.mkdir(parents=True, exist_ok=True)
-
-            # tenta pegar título real da página (às vezes difere do title da API por prefixos)
-            try:
-                page.goto(r["url"], wait_until="domcontentloaded", timeout=120_000)
-                page.wait_for_timeout(600); rolar_ate_fim(page)
-                tit = titulo_real(page)
-            except PWTimeout:
-                tit = r["title"] or "pagina"
+        rows.append({"id": pid, "path": full_path, "title": title, "url": norm_url(url),
+                     "version": d["version"], "modo": args.modo})
+    print(f"Árvore montada: {len(rows)} caminhos")
 
-            nome = re.sub(r'[\\/*?:"<>|]+', " ", f"{tit}.pdf").strip() or "pagina.pdf"
-            destino = pasta / nome
+    # 4) salva links_tree.csv (a árvore inteira, mesmo com --shard)
+    if principal:
+        with links_csv.open("w", encoding="utf-8", newline="") as f:
+            w = csv.writer(f); w.writerow(["path","title","url"])
+            for r in rows:
+                w.writerow([" / ".join(r["path"]), r["title"], r["url"]])
+        print(f"Mapa salvo em: {links_csv}")
 
-            if destino.exists():
-                wlog.writerow([" / ".join(r["path"]), r["title"], r["url"], str(destino), "SKIP", ""]); flog.flush()
-            else:
-                ok=False; err=""
-                for tent in range(3):
-                    try:
-                        salvar_pdf(page, r["url"], destino)
-                        ok=True; break
-                    except Exception as e:
-                        err=str(e); time.sleep(0.8*(tent+1))
-                if ok:
-                    wlog.writerow([" / ".join(r["path"]), r["title"], r["url"], str(destino), "OK", ""])
-                else:
-                    wlog.writerow([" / ".join(r["path"]), r["title"], r["url"], "", "ERRO", err])
-                flog.flush()
-
-            elapsed = time.time()-start
-            rate = (i/elapsed*60) if elapsed>0 else 0.0
-            rem  = int((total-i)/rate*60) if rate>0 else 0
-            eta  = f"{rem//60:02d}:{rem%60:02d}"
-            status_path.write_text(json.dumps({
-                "total": total, "done": i, "last": str(destino),
-                "rate_pages_per_min": round(rate,1), "eta": eta
-            }, ensure_ascii=False), encoding="utf-8")
-            print(f"[{i}/{total}] -> {destino.name} | {rate:.1f} pág/min | ETA {eta}", flush=True)
-
-        ctx.close(); browser.close()
+    atuais = {r["id"] for r in rows}
+    if args.shard:
+        rows = [r for r in rows if tdn_fila.no_shard(r["id"], args.shard)]
+        print(f"Shard {args.shard[0]}/{args.shard[1]}: {len(rows)} páginas")
+
+    # 5) retomada: o que o manifesto já tem pronto nem chega ao navegador
+    manifesto = _MANIFESTO = Manifesto(OUT_BASE / "manifesto.jsonl", compactar=not args.shard)
+    pendentes = []; alterados = 0
+    for r in rows:
+        feito = manifesto.concluido(r["id"])
+        if feito and args.incremental and mudou(r, feito):
+            # versão nova: apaga o PDF antigo e renderiza de novo (se for só
+            # desta página: registro antigo pode apontar para o PDF de outra)
+            if not manifesto.compartilhado(feito["pdf"], r["id"]):
+                Path(feito["pdf"]).unlink(missing_ok=True)
+            alterados += 1
+            feito = None
+        elif feito and "versao" not in feito:
+            # registro de antes do modo incremental: adota a versão atual
+            manifesto.registrar(r["id"], r["url"], feito["pdf"], feito["status"],
+                                versao=r["version"], raiz=root_id)
+        if feito:
+            wlog.writerow([" / ".join(r["path"]), r["title"], r["url"], feito["pdf"], "SKIP", ""])
+        else:
+            pendentes.append(r)
+    if args.incremental:
+        # páginas que saíram da subárvore desde a última execução
+        removidos = [] if not principal else [d for k, d in list(manifesto.itens.items())
+                     if d.get("raiz") == root_id and k not in atuais and d.get("status") != "REMOVIDO"]
+        for d in removidos:
+            if d.get("pdf") and not manifesto.compartilhado(d["pdf"], d["chave"]):
+                Path(d["pdf"]).unlink(missing_ok=True)
+            manifesto.registrar(d["chave"], d["url"], "", "REMOVIDO", raiz=root_id)
+            wlog.writerow(["", "", d["url"], d.get("pdf",""), "REMOVIDO", ""])
+        print(f"Incremental: {len(pendentes)-alterados} novas/pendentes, {alterados} alteradas, {len(removidos)} removidas")
+    flog.flush()
+    if len(pendentes) < len(rows):
+        print(f"Retomando: {len(rows)-len(pendentes)} já prontos no manifesto, {len(pendentes)} a baixar")
+
+    # 6) baixa PDFs mantendo a mesma árvore de pastas (N navegadores em paralelo)
+    total = len(pendentes); start = time.time(); done = 0
+
+    def registrar(r, res, erro):
+        nonlocal done
+        destino, status, err = res if res else (None, "ERRO", str(erro))
+        manifesto.registrar(r["id"], r["url"], destino if status != "ERRO" else "", status,
+                            versao=r["version"], raiz=root_id)
+        if status == "ERRO":
+            wlog.writerow([" / ".join(r["path"]), r["title"], r["url"], "", "ERRO", err])
+        else:
+            wlog.writerow([" / ".join(r["path"]), r["title"], r["url"], str(destino), status, ""])
+        flog.flush()
+
+        done += 1
+        elapsed = time.time()-start
+        rate = (done/elapsed*60) if elapsed>0 else 0.0
+        rem  = int((total-done)/rate*60) if rate>0 else 0
+        eta  = f"{rem//60:02d}:{rem%60:02d}"
+        status_path.write_text(json.dumps({
+            "total": total, "done": done, "last": str(destino or r["url"]),
+            "rate_pages_per_min": round(rate,1), "eta": eta
+        }, ensure_ascii=False), encoding="utf-8")
+        nome = destino.name if destino else "(falha)"
+        print(f"[{done}/{total}] -> {nome} | {rate:.1f} pág/min | ETA {eta}", flush=True)
+
+    if args.processos > 1:
+        # cada processo imprime o próprio resumo de bloqueio
+        tdn_fila.renderizar_em_processos(pendentes, baixar_item, registrar, args.processos,
+                                         workers=args.workers, headless=HEADLESS, perfil=args.perfil,
+                                         caminho_db=OUT_BASE / f".fila_render{sufixo}.sqlite")
+    else:
+        bloqueio = renderizar_em_paralelo(pendentes, baixar_item, registrar,
+                                          workers=args.workers, headless=HEADLESS, perfil=args.perfil)
+        if bloqueio:
+            print(bloqueio.resumo())
 
+    manifesto.fechar()
     flog.close()
     print(f"\n✅ PDFs salvos em: {OUT_BASE.resolve()}\n   - log: {log_path}\n   - mapa: {links_csv}")
 
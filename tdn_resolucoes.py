@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Cache persistente das resoluções título -> página, compartilhado pelos
+resolvedores (resolver_links_tdn, resolver_links_tdn_v2 e a busca nativa).
+
+- Chave: título normalizado (tdn_indice.normalizar_titulo) + quem resolveu.
+- Guarda url, pageId (quando houver), estratégia, nota do acerto e horário.
+- Acertos valem TTL_ACHADO. Para o próprio resolvedor, qualquer acerto;
+  para os outros, só os confiáveis: nota >= NOTA_MIN_COMPARTILHADA (busca
+  nativa) ou, sem nota, estratégia que não seja a aproximada (inclusive a
+  etapa aproximada do lote, gravada como "lote/aproximado"). Um palpite
+  fraco de um resolvedor não passa por cima da busca exata de outro.
+  Entre os que servem, o mais recente vence.
+- "Não encontrado" vale TTL_NAO_ACHADO e só para o próprio resolvedor,
+  já que os outros usam estratégias diferentes.
+- Fica ao lado deste arquivo (não no diretório corrente), para que os
+  scripts das subpastas usem o mesmo banco.
+"""
+import re, sqlite3, threading, time
+from pathlib import Path
+from tdn_indice import normalizar_titulo
+
+# ============= CONFIG =============
+CACHE_DB       = Path(__file__).resolve().parent / ".tdn_resolucoes.sqlite"
+TTL_ACHADO     = 30 * 24 * 3600   # s
+TTL_NAO_ACHADO = 24 * 3600        # s; negativos expiram antes (página pode ser criada)
+NOTA_MIN_COMPARTILHADA = 90       # nota mínima (ex.: fuzz.WRatio) para servir a outros resolvedores
+# =================================
+
+def compartilhavel(estrategia: str, nota) -> bool:
+    """Acerto bom o bastante para servir a outro resolvedor."""
+    if nota is not None:
+        return nota >= NOTA_MIN_COMPARTILHADA
+    return "aproximado" not in (estrategia or "")
+
+class CacheResolucoes:
+    def __init__(self, caminho: Path = CACHE_DB, ttl: float = TTL_ACHADO,
+                 ttl_negativo: float = TTL_NAO_ACHADO):
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(str(caminho), timeout=30, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS resolucoes ("
+            " titulo TEXT, quem TEXT, url TEXT, page_id TEXT,"
+            " estrategia TEXT, nota REAL, ts REAL, PRIMARY KEY (titulo, quem))")
+        self._con.commit()
+
+    def buscar(self, titulo: str, quem: str):
+        """
+        dict(url, page_id, estrategia, nota, quem, ts) válido no TTL, ou None.
+        url == "" é um "não encontrado" ainda válido deste resolvedor.
+        """
+        chave = normalizar_titulo(titulo)
+        agora = time.time()
+        cols = "url, page_id, estrategia, nota, quem, ts"
+        with self._lock:
+            rows = self._con.execute(
+                f"SELECT {cols} FROM resolucoes WHERE titulo=? AND url<>'' AND ts>=?"
+                " ORDER BY ts DESC", (chave, agora - self.ttl)).fetchall()
+            row = next((r for r in rows if r[4] == quem or compartilhavel(r[2], r[3])), None)
+            if not row:
+                row = self._con.execute(
+                    f"SELECT {cols} FROM resolucoes WHERE titulo=? AND quem=? AND url='' AND ts>=?",
+                    (chave, quem, agora - self.ttl_negativo)).fetchone()
+        if not row:
+            return None
+        return dict(zip(("url", "page_id", "estrategia", "nota", "quem", "ts"), row))
+
+    def gravar(self, titulo: str, quem: str, url: str, estrategia: str = "",
+               nota: float = None, page_id: str = None):
+        """Registra a resolução (url vazia = não encontrado)."""
+        if page_id is None:
+            m = re.search(r"[?&]pageId=(\d+)", url or "")
+            page_id = m.group(1) if m else None
+        with self._lock:
+            self._con.execute(
+                "INSERT OR REPLACE INTO resolucoes VALUES (?,?,?,?,?,?,?)",
+                (normalizar_titulo(titulo), quem, url or "", page_id, estrategia, nota, time.time()))
+            self._con.commit()